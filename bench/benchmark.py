@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of station_check.py against a local fake GISSMO API.
+
+fake_gissmo.py is started in a subprocess, then each scenario is run a few
+times with a fresh HTTP client and no disk cache. The wall time, number of
+requests, bytes received, peak Python memory (from one extra traced run)
+and number of findings of each scenario are written as JSON.
+
+Usage:
+    benchmark.py [options]
+
+Example:
+    benchmark.py --stations 200 --latency 0.02 -o before.json
+
+Options:
+    -h --help               Show this screen.
+    --port <port>           Port of the fake API [default: 8765].
+    --stations <n>          Number of stations [default: 50].
+    --channels <n>          Open channels per station [default: 6].
+    --epochs <n>            Closed epochs per open channel [default: 1].
+    --latency <sec>         Delay added to every response [default: 0.01].
+    --repeat <n>            Runs of each scenario [default: 3].
+    -j --jobs <n>           Concurrent requests of station_check.py
+                            [default: 4].
+    --scenario <name>       Only run this scenario: station or network.
+    -o --output <file>      Write the results to <file> instead of the
+                            standard output.
+"""
+from collections import Counter
+from docopt import docopt
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import station_check  # noqa: E402
+
+SCENARIOS = {
+    'station': lambda url: station_check.check_overall_single_station(
+        'S001', url),
+    'network': lambda url: station_check.check_network('FR', url),
+}
+
+
+def start_server(port, stations, channels, epochs, latency):
+    """Start fake_gissmo.py and wait until it accepts connections."""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'fake_gissmo.py'),
+         '--port', str(port), '--stations', str(stations),
+         '--channels', str(channels), '--epochs', str(epochs),
+         '--latency', str(latency)],
+        stdout=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit("fake GISSMO server exited with %d" %
+                     (process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    sys.exit("fake GISSMO server did not start")
+
+
+def run(scenario, url, jobs):
+    """Run scenario once, returning its measures."""
+    station_check.client = station_check.GissmoClient()
+    station_check.client.set_pool_size(max(jobs, 10))
+    # no rate limit against the local server
+    station_check.client.scheduler = station_check.scheduler.RequestScheduler(
+        0, jobs)
+    station_check.jobs = jobs
+    station_check.reset_run_caches()
+    start = time.perf_counter()
+    severities = Counter(f.severity for f in SCENARIOS[scenario](url))
+    return {'seconds': time.perf_counter() - start,
+            'requests': station_check.client.request_count,
+            'bytes': station_check.client.bytes_received,
+            'errors': severities['error'],
+            'warnings': severities['warning']}
+
+
+def bench(scenario, url, jobs, repeat):
+    runs = [run(scenario, url, jobs) for i in range(repeat)]
+    tracemalloc.start()
+    run(scenario, url, jobs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    seconds = [r['seconds'] for r in runs]
+    result = dict(runs[-1])
+    result.update({'seconds': statistics.median(seconds),
+                   'seconds_min': min(seconds),
+                   'peak_memory': peak})
+    return result
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    port = int(args['--port'])
+    url = "http://127.0.0.1:%d/api/v1" % (port)
+    scenarios = sorted(SCENARIOS)
+    if args['--scenario']:
+        if args['--scenario'] not in SCENARIOS:
+            sys.exit("unknown scenario '%s'" % (args['--scenario']))
+        scenarios = [args['--scenario']]
+
+    server = start_server(port, int(args['--stations']),
+                          int(args['--channels']), int(args['--epochs']),
+                          float(args['--latency']))
+    try:
+        results = {'stations': int(args['--stations']),
+                   'channels': int(args['--channels']),
+                   'epochs': int(args['--epochs']),
+                   'latency': float(args['--latency']),
+                   'jobs': int(args['--jobs']),
+                   'scenarios': dict()}
+        for scenario in scenarios:
+            results['scenarios'][scenario] = bench(
+                scenario, url, int(args['--jobs']), int(args['--repeat']))
+            print("%s: %.3f s, %d requests" % (
+                scenario, results['scenarios'][scenario]['seconds'],
+                results['scenarios'][scenario]['requests']),
+                file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait()
+
+    output = sys.stdout
+    if args['--output']:
+        output = open(args['--output'], 'w')
+    json.dump(results, output, indent=2, sort_keys=True)
+    output.write('\n')
+    if output is not sys.stdout:
+        output.close()
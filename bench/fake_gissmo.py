@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the GISSMO API, serving a synthetic FR network.
+
+Usage:
+    fake_gissmo.py [options]
+
+Example:
+    fake_gissmo.py --stations 200 --latency 0.05
+    station_check.py --network FR --url http://127.0.0.1:8765/api/v1
+
+Options:
+    -h --help               Show this screen.
+    --port <port>           Listening port [default: 8765].
+    --stations <n>          Number of stations [default: 20].
+    --channels <n>          Open channels per station, by streams of 3
+                            [default: 6].
+    --epochs <n>            Closed epochs per open channel [default: 1].
+    --latency <sec>         Delay added to every response [default: 0].
+    --seed <n>              Seed of the synthetic defects [default: 0].
+    --page-size <n>         Paginate lists by pages of <n> items, 0 for
+                            plain lists [default: 0].
+"""
+from docopt import docopt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import gzip
+import hashlib
+import json
+import random
+import time
+
+STREAMS = ['HH', 'LH', 'BH', 'EH', 'SH', 'MH']
+COLLECTIONS = ['networks', 'organisms', 'sites', 'documents', 'equipments',
+               'channels', 'channel_parameters', 'ipaddresses', 'services']
+
+
+def build_database(url, stations=20, channels=6, epochs=1, seed=0):
+    """
+    Return the collections of a synthetic database served at url, a few
+    stations having defects for the checks to find.
+    """
+    rng = random.Random(seed)
+    db = dict((name, list()) for name in COLLECTIONS)
+    ids = dict((name, 0) for name in COLLECTIONS)
+
+    def add(collection, **item):
+        ids[collection] += 1
+        item['id'] = ids[collection]
+        item['url'] = "%s/%s/%d/" % (url, collection, item['id'])
+        db[collection].append(item)
+        return item
+
+    fr = add('networks', code='FR')
+    add('networks', code='RA')
+    operator = add('organisms', name='EOST')
+    add('organisms', name='Unknown')
+
+    for i in range(stations):
+        site = add('sites', code="S%03d" % (i), name="Station %d" % (i),
+                   latitude="%.4f" % (rng.uniform(42, 51)),
+                   longitude="%.4f" % (rng.uniform(-4, 8)),
+                   elevation="%.1f" % (rng.uniform(0, 3000)),
+                   latitude_unit='DEGREES', longitude_unit='DEGREES',
+                   elevation_unit='METERS', type='Measuring site',
+                   status='Running',
+                   geology='' if rng.random() < 0.2 else 'Granite',
+                   operator=operator['url'])
+        for doctype in ['Lease', 'Datasheet', 'Picture', 'Analysis report',
+                        'Site proposal']:
+            if rng.random() < 0.9:
+                add('documents', doctype=doctype, title=doctype.lower(),
+                    link="https://example.org/%s/%s.pdf" %
+                    (site['code'], doctype.replace(' ', '_')),
+                    station=site['url'])
+        equipments = dict()
+        for equip_type in ['Velocimeter', 'Datalogger', 'Modem',
+                           'Armoire BT', 'Armoire TBT']:
+            serial_number = "%s-%05d" % (equip_type[:3].upper(),
+                                         ids['equipments'] + 1)
+            if i > 0 and rng.random() < 0.01:
+                # same serial number as the previous station's one
+                serial_number = "%s-%05d" % (equip_type[:3].upper(),
+                                             ids['equipments'] - 4)
+            equipments[equip_type] = add(
+                'equipments', type=equip_type, name="%s-1" % (equip_type),
+                serial_number=serial_number,
+                status='Running' if rng.random() < 0.95 else 'Broken',
+                station=site['url'])
+        modem = equipments['Modem']
+        public_ip = "130.79.%d.%d" % (i // 250, i % 250 + 1)
+        if i > 0 and rng.random() < 0.02:
+            # same public IP as the previous station
+            public_ip = "130.79.%d.%d" % ((i - 1) // 250, (i - 1) % 250 + 1)
+        add('ipaddresses', ip=public_ip, netmask='0.0.0.0',
+            equipment=modem['url'])
+        add('ipaddresses', ip='192.168.1.1', netmask='255.255.255.0',
+            equipment=modem['url'])
+        add('services', protocol='SSH', port=22, description='ssh access',
+            equipment=modem['url'])
+
+        for s in range(max(1, channels // 3)):
+            stream = STREAMS[s % len(STREAMS)]
+            rate = '1.0' if stream[0] == 'L' else '100.0'
+            for comp, azimuth, dip in [('Z', '0.0', '-90.0'),
+                                       ('N', '0.0', '0.0'),
+                                       ('E', '90.0', '0.0')]:
+                if rng.random() < 0.02:
+                    azimuth = '45.0'
+                for e in range(epochs + 1):
+                    # the last epoch is the open one
+                    start = 2000 + e * 5
+                    end = start + 5
+                    if rng.random() < 0.05:
+                        # overlap or gap with the next epoch
+                        end += rng.choice([-1, 1])
+                    chan = add(
+                        'channels', code=stream + comp, location_code='00',
+                        network=fr['url'], station=site['url'],
+                        latitude=site['latitude'],
+                        longitude=site['longitude'],
+                        elevation=site['elevation'], depth='0.0',
+                        latitude_unit='DEGREES', longitude_unit='DEGREES',
+                        elevation_unit='METERS', depth_unit='METERS',
+                        azimuth=azimuth, azimuth_unit='DEGREES', dip=dip,
+                        dip_unit='DEGREES', sample_rate=rate,
+                        sample_rate_unit='SAMPLES/S', clock_drift='0.0',
+                        clock_drift_unit='SECONDS/SAMPLE',
+                        calibration_units='M/S',
+                        datatypes=['CONTINUOUS', 'GEOPHYSICAL'],
+                        storage_format='Steim2',
+                        equipments=[equipments['Velocimeter']['url'],
+                                    equipments['Datalogger']['url']],
+                        start_date="%d-01-01T00:00:00Z" % (start),
+                        end_date=None if e == epochs else
+                        "%d-01-01T00:00:00Z" % (end))
+                    for model, parameter, value in [
+                            ('STS-2', 'gain', 'high'),
+                            ('Q330', 'sample rate', rate)]:
+                        add('channel_parameters', model=model,
+                            parameter=parameter, value=value,
+                            channel=chan['url'])
+    return db
+
+
+def _id_from_url(url):
+    if url is None:
+        return None
+    return url.rstrip('/').split('/')[-1]
+
+
+class FakeGissmo:
+    """
+    Answers the API URLs used by station_check.py from a database, lists
+    being paginated like the Django REST framework does when page_size is
+    set.
+    """
+
+    def __init__(self, db, url, page_size=0):
+        self.db = db
+        self.url = url
+        self.prefix = urlsplit(url).path
+        self.page_size = page_size
+        self.by_id = dict((name, dict((item['id'], item) for item in items))
+                          for name, items in db.items())
+        code_by_url = dict((s['url'], s['code']) for s in db['sites'])
+        # query parameter -> value it matches for an item
+        self.filters = {
+            'code': lambda item: item.get('code'),
+            'station': lambda item: code_by_url.get(item.get('station')),
+            'channel': lambda item: _id_from_url(item.get('channel')),
+            'equipment': lambda item: _id_from_url(item.get('equipment')),
+        }
+        self.indexes = dict()
+
+    def _lookup(self, name, key, value):
+        if (name, key) not in self.indexes:
+            index = dict()
+            for item in self.db[name]:
+                index.setdefault(str(self.filters[key](item)),
+                                 list()).append(item)
+            self.indexes[(name, key)] = index
+        return self.indexes[(name, key)].get(value, list())
+
+    def answer(self, path):
+        """Return the JSON body for path, None if not found."""
+        parts = urlsplit(path)
+        if not parts.path.startswith(self.prefix):
+            return None
+        names = [p for p in parts.path[len(self.prefix):].split('/') if p]
+        if len(names) == 0 or names[0] not in self.db:
+            return None
+        if len(names) == 2:
+            try:
+                return self.by_id[names[0]].get(int(names[1]))
+            except ValueError:
+                return None
+        query = parse_qsl(parts.query)
+        page = 1
+        items = self.db[names[0]]
+        for key, value in query:
+            if key == 'page':
+                page = int(value)
+            elif key in self.filters:
+                items = self._lookup(names[0], key, value)
+            else:
+                return None
+        if self.page_size == 0:
+            return items
+        start = (page - 1) * self.page_size
+        next_url = None
+        if start + self.page_size < len(items):
+            next_url = "%s/%s/?%s" % (
+                self.url, names[0],
+                urlencode([(k, v) for k, v in query if k != 'page'] +
+                          [('page', page + 1)]))
+        return {'count': len(items), 'next': next_url,
+                'previous': None,
+                'results': items[start:start + self.page_size]}
+
+
+class FakeGissmoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        body = self.server.gissmo.answer(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = json.dumps(body).encode('utf-8')
+        etag = '"%s"' % (hashlib.sha1(data).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port=8765, stations=20, channels=6, epochs=1, latency=0,
+                seed=0, page_size=0):
+    url = "http://127.0.0.1:%d/api/v1" % (port)
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeGissmoHandler)
+    server.daemon_threads = True
+    server.gissmo = FakeGissmo(build_database(url, stations, channels,
+                                              epochs, seed),
+                               url, page_size)
+    server.latency = latency
+    return server
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    server = make_server(int(args['--port']), int(args['--stations']),
+                         int(args['--channels']), int(args['--epochs']),
+                         float(args['--latency']), int(args['--seed']),
+                         int(args['--page-size']))
+    print("Fake GISSMO API on http://127.0.0.1:%s/api/v1" % (args['--port']),
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
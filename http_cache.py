@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of GISSMO responses.
+
+Bodies are stored zlib-compressed in a SQLite file, keyed by URL, together
+with the ETag/Last-Modified validators sent by the server. A response is
+served from disk while younger than the TTL of its endpoint, then it is
+revalidated with a conditional request. Collections and filtered queries,
+which change as soon as someone edits the database, have no TTL: they are
+revalidated on every use, and only downloaded again when they changed.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache',
+                            'rlbp_gissmo_check', 'http.sqlite')
+DEFAULT_MAX_SIZE = 200 * 1024 * 1024
+
+# time to live (seconds) of responses, first matching URL pattern wins
+DEFAULT_TTLS = [
+    (r'/networks/\d+/$', 7 * 24 * 3600),
+    # single resources: operators, equipments, sites, ...
+    (r'/\w+/\d+/$', 24 * 3600),
+    # whole collections and filtered queries, always revalidated
+    (r'.', 0),
+]
+
+
+class CachedResponse:
+    __slots__ = ['url', 'body', 'etag', 'last_modified', 'fetched']
+
+    def __init__(self, url, body, etag, last_modified, fetched):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched = fetched
+
+    def iter_content(self, chunk_size):
+        """
+        Yield the body by chunks of at most chunk_size bytes, decompressed
+        as they are read so that the whole body is never held in memory.
+        """
+        decompressor = zlib.decompressobj()
+        data = self.body
+        while data:
+            chunk = decompressor.decompress(data, chunk_size)
+            if chunk:
+                yield chunk
+            data = decompressor.unconsumed_tail
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+
+    def validators(self):
+        """Headers turning a request on url into a conditional one."""
+        headers = dict()
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """
+    SQLite store of compressed responses, shared by the threads of a run.
+
+    refresh makes every cached response stale, so that it is revalidated
+    against the server before being used.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_size=DEFAULT_MAX_SIZE,
+                 ttls=None, refresh=False):
+        self.path = path
+        self.max_size = max_size
+        self.ttls = [(re.compile(p), t)
+                     for p, t in (ttls if ttls is not None else DEFAULT_TTLS)]
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                url TEXT PRIMARY KEY,
+                                body BLOB NOT NULL,
+                                etag TEXT,
+                                last_modified TEXT,
+                                fetched REAL NOT NULL,
+                                accessed REAL NOT NULL,
+                                size INTEGER NOT NULL)""")
+        self._db.execute("""CREATE INDEX IF NOT EXISTS responses_accessed
+                            ON responses (accessed)""")
+        self._db.commit()
+
+    def ttl(self, url):
+        for pattern, ttl in self.ttls:
+            if pattern.search(url.split('?')[0]):
+                return ttl
+        return 0
+
+    def lookup(self, url):
+        with self._lock:
+            row = self._db.execute("""SELECT body, etag, last_modified, fetched
+                                      FROM responses WHERE url = ?""",
+                                   (url,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? "
+                             "WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        return CachedResponse(url, *row)
+
+    def is_fresh(self, entry):
+        if self.refresh:
+            return False
+        return time.time() - entry.fetched < self.ttl(entry.url)
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """Store body, already zlib-compressed, as the response of url."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("""INSERT OR REPLACE INTO responses
+                                (url, body, etag, last_modified, fetched,
+                                 accessed, size)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                             (url, body, etag, last_modified, now, now,
+                              len(body)))
+            self._evict()
+            self._db.commit()
+
+    def touch(self, url):
+        """Mark the response of url as revalidated by the server."""
+        with self._lock:
+            self._db.execute("UPDATE responses SET fetched = ? WHERE url = ?",
+                             (time.time(), url))
+            self._db.commit()
+
+    def _evict(self):
+        # drop least recently used responses until under the size cap
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) "
+                                 "FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self._db.execute("SELECT url, size FROM responses "
+                                "ORDER BY accessed").fetchall()
+        victims = list()
+        for url, size in rows:
+            if total <= self.max_size:
+                break
+            victims.append((url,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE url = ?", victims)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
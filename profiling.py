@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Profile of a station_check.py run (--profile).
+
+Requests are grouped by endpoint pattern, the URL with ids and query values
+blanked out (e.g. /channel_parameters/?channel=*), with their count,
+latency percentiles and body bytes. Checks are timed per function, CPU
+time of the calling thread and wall time, nested checks included.
+"""
+import functools
+import inspect
+import json
+import numpy as np
+import re
+import sys
+import threading
+import time
+
+
+def endpoint_pattern(url, base_url=''):
+    if base_url and url.startswith(base_url):
+        url = url[len(base_url):]
+    path, _, query = url.partition('?')
+    path = re.sub(r'/\d+(?=/|$)', '/<id>', path)
+    if query:
+        path += '?' + '&'.join("%s=*" % (p.split('=')[0])
+                               for p in query.split('&'))
+    return path
+
+
+class Profiler:
+    """Requests and check timings collected during a run."""
+
+    def __init__(self, base_url=''):
+        self.base_url = base_url
+        self.requests = dict()
+        self.checks = dict()
+        self._lock = threading.Lock()
+
+    def add_request(self, url, seconds, nbytes):
+        pattern = endpoint_pattern(url, self.base_url)
+        with self._lock:
+            latencies, sizes = self.requests.setdefault(pattern,
+                                                        (list(), list()))
+            latencies.append(seconds)
+            sizes.append(nbytes)
+
+    def add_check(self, name, cpu, wall):
+        with self._lock:
+            timing = self.checks.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += cpu
+            timing[2] += wall
+
+    def client(self, client):
+        return ProfiledClient(client, self)
+
+    def instrument(self, namespace, prefix='check_'):
+        """
+        Replace the functions of namespace (a module globals()) whose name
+        starts with prefix by timed ones.
+        """
+        for name, f in list(namespace.items()):
+            if name.startswith(prefix) and inspect.isfunction(f):
+                namespace[name] = self.timed(f)
+
+    def timed(self, f):
+        # checks are generators: the time spent producing their findings is
+        # only known once they are consumed
+        def timed_generator(*args, **kwargs):
+            cpu = wall = 0.0
+            findings = f(*args, **kwargs)
+            try:
+                while True:
+                    cpu0, wall0 = time.thread_time(), time.perf_counter()
+                    try:
+                        finding = next(findings)
+                    except StopIteration:
+                        break
+                    finally:
+                        cpu += time.thread_time() - cpu0
+                        wall += time.perf_counter() - wall0
+                    yield finding
+            finally:
+                self.add_check(f.__name__, cpu, wall)
+
+        def timed_function(*args, **kwargs):
+            cpu0, wall0 = time.thread_time(), time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                self.add_check(f.__name__, time.thread_time() - cpu0,
+                               time.perf_counter() - wall0)
+
+        if inspect.isgeneratorfunction(f):
+            return functools.wraps(f)(timed_generator)
+        return functools.wraps(f)(timed_function)
+
+    def as_dict(self):
+        with self._lock:
+            requests = dict()
+            for pattern, (latencies, sizes) in self.requests.items():
+                p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+                requests[pattern] = {'count': len(latencies),
+                                     'total_seconds': sum(latencies),
+                                     'p50': float(p50), 'p90': float(p90),
+                                     'p99': float(p99),
+                                     'max': max(latencies),
+                                     'bytes': sum(sizes)}
+            checks = dict((name, {'calls': calls, 'cpu_seconds': cpu,
+                                  'wall_seconds': wall})
+                          for name, (calls, cpu, wall) in self.checks.items())
+        return {'requests': requests, 'checks': checks}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def print_summary(self, file=sys.stderr):
+        profile = self.as_dict()
+        print("%-40s %6s %8s %8s %8s %10s" % ('Endpoint', 'count', 'p50 ms',
+                                              'p90 ms', 'p99 ms', 'bytes'),
+              file=file)
+        for pattern, r in sorted(profile['requests'].items(),
+                                 key=lambda kv: -kv[1]['total_seconds']):
+            print("%-40s %6d %8.1f %8.1f %8.1f %10d" % (
+                pattern, r['count'], r['p50'] * 1000, r['p90'] * 1000,
+                r['p99'] * 1000, r['bytes']), file=file)
+        print("", file=file)
+        print("%-40s %6s %10s %10s" % ('Check', 'calls', 'CPU s', 'wall s'),
+              file=file)
+        for name, c in sorted(profile['checks'].items(),
+                              key=lambda kv: -kv[1]['cpu_seconds']):
+            print("%-40s %6d %10.3f %10.3f" % (
+                name, c['calls'], c['cpu_seconds'], c['wall_seconds']),
+                file=file)
+
+
+class ProfiledClient:
+    """
+    Wrapper of an HTTP or snapshot client timing each response body, from
+    the request to its last chunk, the time spent by the caller between
+    chunks excluded.
+    """
+
+    def __init__(self, client, profiler):
+        self.wrapped = client
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def iter_content(self, url, chunk_size=65536):
+        seconds = 0.0
+        nbytes = 0
+        chunks = self.wrapped.iter_content(url, chunk_size)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.perf_counter() - start
+                nbytes += len(chunk)
+                yield chunk
+        finally:
+            self.profiler.add_request(url, seconds, nbytes)
+
+    def get_content(self, url):
+        return b''.join(self.iter_content(url))
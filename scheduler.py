@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduling of the requests sent to the GISSMO server.
+
+Requests are spaced by a token bucket (at most `rate` per second) and
+limited by an AIMD concurrency window: the window grows by one request per
+window of healthy answers, and is halved when an answer is an error or
+much slower than the fastest one seen. Idempotent GETs failing on a
+connection error or a transient status are retried with jittered
+exponential backoff, or after the delay asked by Retry-After. A request
+holds its window slot until its body is read, and a body cut before
+anything was read from it is requested again.
+"""
+from email.utils import parsedate_to_datetime
+import random
+import requests
+import threading
+import time
+import urllib3
+
+# statuses worth sending the same request again
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+# errors worth sending the same request again, the connection failing or
+# being cut while the body is read
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+                urllib3.exceptions.ProtocolError)
+
+
+class TokenBucket:
+    """At most rate acquisitions per second, bursts of up to burst."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # the token is reserved now, the caller waits for it outside
+            # of the lock
+            self.tokens -= 1
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AimdWindow:
+    """
+    Number of requests allowed in flight, between min_size and max_size.
+
+    An answer is slow when its latency exceeds slow_factor times the
+    fastest latency seen, and min_slow seconds.
+    """
+
+    def __init__(self, max_size, min_size=1, slow_factor=3.0, min_slow=1.0):
+        self.max_size = max(1, max_size)
+        self.min_size = min(min_size, self.max_size)
+        self.size = float(self.max_size)
+        self.slow_factor = slow_factor
+        self.min_slow = min_slow
+        self.in_flight = 0
+        self.base_latency = None
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.size):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, failed=False):
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None and (self.base_latency is None or
+                                        latency < self.base_latency):
+                self.base_latency = latency
+            if failed or self._is_slow(latency):
+                self._decrease()
+            else:
+                self.size = min(self.max_size, self.size + 1.0 / self.size)
+            self._cond.notify_all()
+
+    def _is_slow(self, latency):
+        if latency is None or self.base_latency is None:
+            return False
+        return latency > max(self.slow_factor * self.base_latency,
+                             self.min_slow)
+
+    def _decrease(self):
+        # requests in flight when trouble starts all fail or slow down
+        # together, the window is only halved once for them
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.size = max(float(self.min_size), self.size / 2)
+
+
+def retry_after(response, max_delay=300):
+    """Delay (seconds) asked by the Retry-After header of response."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(0.0, delay), max_delay)
+
+
+class RequestScheduler:
+    """
+    Sender of idempotent requests on behalf of GissmoClient, rate is in
+    requests per second (0 for no limit) and max_window the maximum
+    number of concurrent requests.
+    """
+
+    def __init__(self, rate=10, max_window=4, retries=3, backoff=0.5,
+                 max_backoff=30):
+        self.bucket = TokenBucket(rate)
+        self.window = AimdWindow(max_window)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retried = 0
+        self._lock = threading.Lock()
+
+    def delay(self, attempt):
+        # "full jitter": clients retrying together do not hit the server
+        # again at the same time
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+    def count_retry(self):
+        with self._lock:
+            self.retried += 1
+
+    def stream(self, request, read):
+        """
+        Yield what read(response) yields from the response of request(), a
+        callable sending the request. The request is sent again while it
+        fails on a transient error before anything was yielded and retries
+        are left, otherwise the last error is raised, or read() is given
+        the last failed response.
+
+        The window slot of the request is held until its body is read, the
+        latency fed to the window excluding the time the caller spends
+        between two chunks.
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            self.window.acquire()
+            start = time.monotonic()
+            waited = 0.0
+            failed = False
+            yielded = False
+            delay = None
+            try:
+                response = request()
+                if response.status_code in RETRY_STATUSES:
+                    failed = True
+                    if attempt < self.retries:
+                        delay = retry_after(response)
+                        if delay is None:
+                            delay = self.delay(attempt)
+                        response.close()
+                if delay is None:
+                    for chunk in read(response):
+                        yielded = True
+                        paused = time.monotonic()
+                        yield chunk
+                        waited += time.monotonic() - paused
+                    return
+            except RETRY_ERRORS:
+                failed = True
+                if yielded or attempt >= self.retries:
+                    raise
+                delay = self.delay(attempt)
+            finally:
+                self.window.release(
+                    None if failed else time.monotonic() - start - waited,
+                    failed)
+            self.count_retry()
+            attempt += 1
+            time.sleep(delay)
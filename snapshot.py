@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Local snapshot of the GISSMO database.
+
+A snapshot is a SQLite file holding every item the checks use, indexed by
+station code, channel id and equipment id. SnapshotClient serves the same
+URLs as the GISSMO API from such a file, so that the checks run without any
+network access.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+# query parameters of the API that can be answered from a snapshot
+KEYS = ['code', 'station', 'channel', 'equipment']
+
+
+def write_snapshot(path, url, rows):
+    """
+    Write a snapshot of the database at url into path.
+
+    rows yields (collection, item_url, keys, item) tuples, keys mapping the
+    names of KEYS to the values the item is looked up by.
+    """
+    tmp_path = "%s.tmp" % (path)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    db.execute("""CREATE TABLE items (collection TEXT NOT NULL,
+                                      url TEXT UNIQUE,
+                                      code TEXT,
+                                      station TEXT,
+                                      channel TEXT,
+                                      equipment TEXT,
+                                      data TEXT NOT NULL)""")
+    db.executemany("""INSERT OR IGNORE INTO items
+                      (collection, url, code, station, channel, equipment,
+                       data)
+                      VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                   ((collection, item_url) +
+                    tuple(_key(keys.get(k)) for k in KEYS) +
+                    (json.dumps(item),)
+                    for collection, item_url, keys, item in rows))
+    for k in KEYS:
+        db.execute("CREATE INDEX items_%s ON items (collection, %s)" % (k, k))
+    db.executemany("INSERT INTO meta VALUES (?, ?)",
+                   [('url', url), ('created', str(time.time()))])
+    db.commit()
+    db.close()
+    os.replace(tmp_path, path)
+
+
+def _key(value):
+    return None if value is None else str(value)
+
+
+class SnapshotClient:
+    """
+    Stand-in for the HTTP client answering API requests from a snapshot.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise IOError("snapshot %s not found" % (path))
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        self.url = meta['url']
+        self.created = float(meta['created'])
+        self.request_count = 0
+        self.bytes_received = 0
+
+    def _query(self, url):
+        if url.startswith(self.url):
+            path = url[len(self.url):]
+        else:
+            # resources are referenced by their absolute URL
+            return ("SELECT data FROM items WHERE url = ?", (url,), False)
+        parts = urlsplit(path)
+        names = [p for p in parts.path.split('/') if p]
+        if len(names) == 2:
+            return ("SELECT data FROM items WHERE url = ?",
+                    ("%s/%s/%s/" % (self.url, names[0], names[1]),), False)
+        if len(names) != 1:
+            raise ValueError("%s not available in snapshot" % (url))
+        sql = "SELECT data FROM items WHERE collection = ?"
+        params = [names[0]]
+        for k, v in parse_qsl(parts.query):
+            if k not in KEYS:
+                raise ValueError("%s not available in snapshot" % (url))
+            sql += " AND %s = ?" % (k)
+            params.append(v)
+        return (sql + " ORDER BY rowid", tuple(params), True)
+
+    def iter_content(self, url, chunk_size=None):
+        sql, params, many = self._query(url)
+        with self._lock:
+            self.request_count += 1
+            rows = self._db.execute(sql, params).fetchall()
+        if not many:
+            if len(rows) == 0:
+                raise ValueError("%s not available in snapshot" % (url))
+            yield rows[0][0].encode('utf-8')
+            return
+        yield b'['
+        for i, (data,) in enumerate(rows):
+            if i > 0:
+                yield b','
+            yield data.encode('utf-8')
+        yield b']'
+
+    def get_content(self, url):
+        return b''.join(self.iter_content(url))
+
+    def print_stats(self, file=sys.stderr):
+        print("Snapshot queries: %d" % (self.request_count), file=file)
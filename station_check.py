@@ -2,20 +2,96 @@
 # -*- coding: utf-8 -*-
 """
 Usage:
-    station_check.py --sta <sta>
+    station_check.py --sta <sta> [options]
+    station_check.py --network <net> [options]
+    station_check.py --all [options]
+    station_check.py snapshot <file> [options]
+    station_check.py diff <old> <new> [--network <net>] [options]
 
 Example:
     station_check.py --sta CHMF
+    station_check.py --network FR
+    station_check.py snapshot gissmo.sqlite
+    station_check.py --all --snapshot gissmo.sqlite
+    station_check.py diff gissmo.sqlite live --network FR
+
+The old and new databases of diff are snapshot files, or 'live' for the API.
 
 Options:
-    -h --help           Show this screen.
-    --version           Show version.
-    -s --sta <sta>      Set station code.
+    -h --help                   Show this screen.
+    --version                   Show version.
+    -s --sta <sta>              Set station code.
+    -n --network <net>          Check every station of a network.
+    -a --all                    Check every station of the database.
+    --url <url>                 GISSMO API
+                                [default: https://gissmo.unistra.fr/api/v1].
+    --timeout <sec>             Read timeout of HTTP requests [default: 30].
+    --connect-timeout <sec>     Connect timeout of HTTP requests [default: 5].
+    --stats                     Print HTTP request statistics at the end.
+    --profile <file>            Print the requests per endpoint and the time
+                                spent in each check at the end, and write
+                                them as JSON into <file>.
+    -j --jobs <n>               Maximum number of concurrent requests
+                                [default: 4].
+    --rate <n>                  Maximum number of requests per second, 0
+                                for no limit [default: 10].
+    --retries <n>               Number of times a request failing on a
+                                transient error is sent again [default: 3].
+    --cache <file>              HTTP cache file, by default
+                                ~/.cache/rlbp_gissmo_check/http.sqlite.
+    --no-cache                  Do not use the HTTP cache.
+    --refresh                   Revalidate every cached response.
+    -f --format <fmt>           Report format: text, jsonl or csv
+                                [default: text].
+    -o --output <file>          Write the report to <file> instead of the
+                                standard output.
+    --state <file>              With --network or --all, keep the findings
+                                of each station in <file> and only check
+                                again the stations whose data changed.
+    --watch                     Keep running: check the stations again
+                                periodically and serve the latest findings
+                                as JSON.
+    --interval <sec>            Delay between two checks in watch mode
+                                [default: 3600].
+    --listen <addr>             Address of the findings endpoint in watch
+                                mode [default: 127.0.0.1:8080].
+    --epochs                    Also check the epoch history of channels
+                                (overlaps, gaps) and of equipments
+                                (installed at two stations at once).
+    --snapshot <file>           Check against a snapshot written by the
+                                'snapshot' command instead of the API.
+    --doc-index <file>          Keep the station/documents index in <file>
+                                and reuse it while it is less than a day
+                                old.
 """
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from docopt import docopt
+from itertools import chain
+import codecs
+import csv
+import datetime
+import hashlib
+import http_cache
+import json
 import numpy as np
+import os
+import profiling
 import re
 import requests
+import scheduler
+import snapshot
+import sys
+import threading
+import time
+import watch
+import zlib
+
+try:
+    # faster decoding of the API answers when available
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class bcolors:
@@ -23,146 +99,861 @@ class bcolors:
     WARNING = '\033[33m[warning]\033[0m'
 
 
+class Finding:
+    """
+    One result of a check: an error, a warning, or a line of the station
+    report (severity 'info').
+    """
+
+    __slots__ = ['severity', 'station', 'channel', 'rule', 'message',
+                 'values']
+
+    def __init__(self, severity, rule, message, channel=None, values=None,
+                 station=None):
+        self.severity = severity
+        self.station = station
+        self.channel = channel
+        self.rule = rule
+        self.message = message
+        self.values = values
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+
+def _info(message):
+    return Finding('info', 'report', message)
+
+
+def _warning(rule, message, channel=None, values=None):
+    return Finding('warning', rule, message, channel, values)
+
+
+def _error(rule, message, channel=None, values=None):
+    return Finding('error', rule, message, channel, values)
+
+
+class TextSink:
+    """Coloured text report, as read by humans."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, finding):
+        if finding.severity == 'error':
+            line = "%s %s" % (bcolors.ERROR, finding.message)
+        elif finding.severity == 'warning':
+            line = "%s %s" % (bcolors.WARNING, finding.message)
+        else:
+            line = finding.message
+        self.stream.write(line + '\n')
+
+    def flush(self):
+        self.stream.flush()
+
+
+class JsonLinesSink(TextSink):
+    """One JSON object per error or warning."""
+
+    def write(self, finding):
+        if finding.severity != 'info':
+            self.stream.write(json.dumps(finding.as_dict()) + '\n')
+
+
+class CsvSink(TextSink):
+    """One CSV row per error or warning, values being JSON encoded."""
+
+    def __init__(self, stream):
+        TextSink.__init__(self, stream)
+        self.writer = csv.writer(stream)
+        self.writer.writerow(Finding.__slots__)
+
+    def write(self, finding):
+        if finding.severity != 'info':
+            row = finding.as_dict()
+            row['values'] = json.dumps(row['values'])
+            self.writer.writerow([row[k] for k in Finding.__slots__])
+
+
+SINKS = {'text': TextSink, 'jsonl': JsonLinesSink, 'csv': CsvSink}
+
+
+def report(findings, sink):
+    """Write findings to sink as they come, flushing after each station."""
+    station = None
+    for f in findings:
+        if f.station != station:
+            sink.flush()
+            station = f.station
+        sink.write(f)
+    sink.flush()
+
+
+class GissmoClient:
+    """
+    HTTP client shared by all get_* helpers.
+
+    Connections to the GISSMO server are pooled and kept alive between
+    requests, so that a check does not pay a TLS handshake per call.
+    Requests go through a scheduler.RequestScheduler, which rate-limits
+    them and retries the ones failing on transient errors.
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=5, read_timeout=30):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept': 'application/json',
+                                     'Accept-Encoding': 'gzip',
+                                     'Connection': 'keep-alive'})
+        self.timeout = (connect_timeout, read_timeout)
+        self.request_count = 0
+        self.bytes_received = 0
+        self.cache_hits = 0
+        # optional on-disk cache (http_cache.HttpCache) of the responses
+        self.cache = None
+        self.scheduler = scheduler.RequestScheduler()
+        self._lock = threading.Lock()
+
+    def set_timeouts(self, connect_timeout, read_timeout):
+        self.timeout = (connect_timeout, read_timeout)
+
+    def set_pool_size(self, pool_size):
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def iter_content(self, url, chunk_size=65536):
+        """
+        Yield the body of url by chunks, from the disk cache while the
+        cached response is fresh. Downloaded bodies are compressed into the
+        cache as they arrive.
+        """
+        entry = None
+        headers = None
+        if self.cache is not None:
+            entry = self.cache.lookup(url)
+            if entry is not None:
+                if self.cache.is_fresh(entry):
+                    with self._lock:
+                        self.cache_hits += 1
+                    yield from entry.iter_content(chunk_size)
+                    return
+                headers = entry.validators()
+
+        def send():
+            with self._lock:
+                self.request_count += 1
+            return self.session.get(url, timeout=self.timeout, stream=True,
+                                    headers=headers)
+
+        def read(req):
+            return self._read(url, req, entry, chunk_size)
+
+        yield from self.scheduler.stream(send, read)
+
+    def _read(self, url, req, entry, chunk_size):
+        try:
+            # 304 answers conditional requests of iter_content()
+            if req.status_code != 200 and req.status_code != 304:
+                req.raise_for_status()
+            if req.status_code == 304:
+                self.cache.touch(url)
+                with self._lock:
+                    self.cache_hits += 1
+                yield from entry.iter_content(chunk_size)
+                return
+            compressor = None
+            compressed = list()
+            if self.cache is not None:
+                compressor = zlib.compressobj()
+            for chunk in req.iter_content(chunk_size):
+                if compressor is not None:
+                    compressed.append(compressor.compress(chunk))
+                yield chunk
+            if compressor is not None:
+                compressed.append(compressor.flush())
+                self.cache.store(url, b''.join(compressed),
+                                 req.headers.get('ETag'),
+                                 req.headers.get('Last-Modified'))
+        finally:
+            self.count_bytes(req)
+            req.close()
+
+    def get_content(self, url):
+        return b''.join(self.iter_content(url))
+
+    def count_bytes(self, req):
+        # bytes pulled over the wire, i.e. before gzip decoding
+        try:
+            nbytes = req.raw.tell()
+        except AttributeError:
+            nbytes = len(req.content)
+        with self._lock:
+            self.bytes_received += nbytes
+
+    def print_stats(self, file=sys.stderr):
+        print("HTTP requests: %d" % (self.request_count), file=file)
+        print("Bytes received: %d" % (self.bytes_received), file=file)
+        print("Requests sent again: %d" % (self.scheduler.retried),
+              file=file)
+        if self.cache is not None:
+            print("Responses served by cache: %d" % (self.cache_hits),
+                  file=file)
+
+
+client = GissmoClient()
+
+# a persisted document index older than this (seconds) is rebuilt
+DOC_INDEX_MAX_AGE = 24 * 3600
+
+# maximum number of requests running at the same time (--jobs)
+jobs = 4
+
+# check the epoch history of channels and equipments too (--epochs)
+epoch_checks = False
+
+
+def enabled_checks():
+    """Optional checks enabled for this run, part of the --state rules."""
+    return {'epochs': epoch_checks}
+
+
+def loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
 def get_json(url):
-    req = requests.get(url)
-    if req.status_code != 200:
-        req.raise_for_status()
-    data = req.json()
+    data = loads(client.get_content(url))
     return data
 
 
+def get_list(url):
+    return list(iter_json_items(url))
+
+
+def iter_json_items(url, chunk_size=65536):
+    """
+    Yield the items of the JSON list found at url one by one.
+
+    A body larger than one chunk is decoded as it arrives instead of being
+    loaded whole. Paginated answers ({"results": [...], "next": <url>})
+    are followed page after page. A page cut by a transient error is read
+    again, its items already yielded being skipped.
+    """
+    while url is not None:
+        url = yield from _retry_page(url, chunk_size)
+
+
+def _retry_page(url, chunk_size):
+    # return the URL of the next page, None for the last one
+    done = 0
+    attempt = 0
+    while True:
+        items = _iter_page(url, chunk_size)
+        seen = 0
+        try:
+            while True:
+                try:
+                    item = next(items)
+                except StopIteration as stop:
+                    return stop.value
+                seen += 1
+                if seen > done:
+                    done = seen
+                    yield item
+        except scheduler.RETRY_ERRORS:
+            if attempt >= client.scheduler.retries:
+                raise
+            client.scheduler.count_retry()
+            time.sleep(client.scheduler.delay(attempt))
+            attempt += 1
+
+
+def _iter_page(url, chunk_size):
+    chunks = client.iter_content(url, chunk_size)
+    head = [c for c in [next(chunks, None), next(chunks, None)]
+            if c is not None]
+    if len(head) == 2 and head[0].lstrip()[:1] != b'{':
+        yield from _iter_list(url, chain(head, chunks))
+        return None
+    # a single chunk or a page, decoded at once
+    page = loads(b''.join(chain(head, chunks)))
+    if isinstance(page, list):
+        yield from page
+        return None
+    if not isinstance(page, dict) or 'results' not in page:
+        raise ValueError("%s does not return a list" % url)
+    yield from page['results']
+    return page.get('next')
+
+
+def _iter_list(url, chunks):
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    started = False
+    finished = False
+    # the body is read up to its end, so that it can be cached
+    for chunk in chunks:
+        if finished:
+            continue
+        buf += utf8.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError("%s does not return a list" % url)
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                finished = True
+                break
+            try:
+                item, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # item not complete yet, wait for next chunk
+                break
+            yield item
+        buf = buf[pos:]
+    if not finished:
+        raise ValueError("truncated JSON list at %s" % url)
+
+
+# hyperlinked resources (operators, networks, equipments, sites) already
+# fetched during this run, keyed by URL
+_resources = dict()
+_resources_since = time.time()
+
+# resources kept between the runs of a watcher are dropped after this
+# long (seconds), the TTL of single resources in the disk cache
+RESOURCE_MAX_AGE = 24 * 3600
+
+
+def get_resource(url):
+    if url not in _resources:
+        _resources[url] = get_json(url)
+    return _resources[url]
+
+
+def resolve_resources(urls):
+    """
+    Fetch the hyperlinked resources of urls not known yet, each one once
+    and concurrently, so that the following get_resource() calls on any of
+    urls are served locally.
+    """
+    missing = sorted(set(u for u in urls
+                         if u is not None and u not in _resources))
+    if len(missing) > 0:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for u, data in zip(missing, pool.map(get_json, missing)):
+                _resources[u] = data
+
+
+def reset_run_caches(keep_resources=False):
+    """
+    Forget what was built from collections or validated during a run, so
+    that the next run sees the changes made in the database meanwhile.
+
+    With keep_resources, the hyperlinked resources fetched so far are kept
+    for up to RESOURCE_MAX_AGE: the collections of the next run refresh the
+    ones they hold, and a single resource is not fresher in the disk cache
+    either. The HTTP session and the disk cache are always kept.
+    """
+    global _doc_index, _resources_since
+    if not keep_resources or \
+       time.time() - _resources_since > RESOURCE_MAX_AGE:
+        _resources.clear()
+        _resources_since = time.time()
+    _validated_positions.clear()
+    _validated_channels.clear()
+    _doc_index = None
+
+
+def _id_from_url(url):
+    return str(url).rstrip('/').split('/')[-1]
+
+
+def get_collection(name, url):
+    return get_list("%s/%s/" % (url, name))
+
+
 def get_station_json(sta_code, url):
-    return get_json("%s/%s%s" % (url, "sites/?code=", sta_code))
+    return get_list("%s/%s%s" % (url, "sites/?code=", sta_code))
+
+
+class DocumentIndex:
+    """
+    Documents of the database grouped by station id.
+
+    Only the fields used by the checks are kept, and the index is built
+    while the /documents collection is streamed, so the whole list is never
+    held in memory.
+    """
+
+    fields = ['doctype', 'title', 'link', 'station']
+
+    def __init__(self, url, docs=None, built=None):
+        self.url = url
+        self.docs = docs if docs is not None else dict()
+        self.built = built if built is not None else time.time()
+
+    @classmethod
+    def build(cls, url):
+        index = cls(url)
+        for d in iter_json_items("%s/%s/" % (url, "documents")):
+            sta_id = _id_from_url(d['station'])
+            index.docs.setdefault(sta_id, list()).append(
+                dict((f, d.get(f)) for f in cls.fields))
+        return index
+
+    @classmethod
+    def load(cls, url, path, max_age=DOC_INDEX_MAX_AGE):
+        """
+        Return the index saved in path if it is recent enough and has been
+        built from the same database, None otherwise.
+        """
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get('url') != url or \
+           time.time() - saved.get('built', 0) > max_age:
+            return None
+        return cls(url, saved['docs'], saved['built'])
+
+    def save(self, path):
+        tmp_path = "%s.tmp" % (path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'url': self.url, 'built': self.built,
+                       'docs': self.docs}, f)
+        os.replace(tmp_path, path)
+
+    def get(self, sta_id):
+        return self.docs.get(str(sta_id), list())
+
+
+# file where the document index is persisted between runs (--doc-index)
+doc_index_path = None
+_doc_index = None
+
+
+def get_doc_index(url):
+    global _doc_index
+    if _doc_index is None or _doc_index.url != url:
+        _doc_index = None
+        if doc_index_path is not None:
+            _doc_index = DocumentIndex.load(url, doc_index_path)
+        if _doc_index is None:
+            _doc_index = DocumentIndex.build(url)
+            if doc_index_path is not None:
+                _doc_index.save(doc_index_path)
+    return _doc_index
 
 
 def get_docs_from_station(sta_id, url):
-    all_doc_list = get_json("%s/%s" % (url, "documents"))
-    sta_url = "https://gissmo.unistra.fr/api/v1/sites/%s/" % (sta_id)
-    doc_list = list()
-    for d in all_doc_list:
-        if d['station'] == sta_url:
-            doc_list.append(d)
-    return doc_list
+    return get_doc_index(url).get(sta_id)
 
 
 def get_equip_from_station(sta_code, url):
-    return get_json("%s/%s%s" % (url, "equipments/?station=", sta_code))
+    return get_list("%s/%s%s" % (url, "equipments/?station=", sta_code))
 
 
 def get_chan_from_station(sta_code, url):
-    return get_json("%s/%s%s" % (url, "channels/?station=", sta_code))
+    return get_list("%s/%s%s" % (url, "channels/?station=", sta_code))
 
 
 def get_parameter_from_chan(chan_id, url):
-    return get_json("%s/%s%s" % (url, "channel_parameters/?channel=", chan_id))
+    return get_list("%s/%s%s" % (url, "channel_parameters/?channel=", chan_id))
+
+
+def get_parameters_from_chans(chan_ids, url):
+    """
+    Return the channel parameters of chan_ids grouped by channel id.
+
+    The API only filters channel_parameters by a single channel id, so this
+    sends one channel_parameters/?channel=<id> query per channel (N
+    requests, run concurrently) rather than one bulk request. Only the
+    network check gets every parameter in a single pull, see NetworkIndex.
+    """
+    chan_ids = [str(chan_id) for chan_id in chan_ids]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        param_lists = pool.map(get_parameter_from_chan, chan_ids,
+                               [url] * len(chan_ids))
+        return dict(zip(chan_ids, param_lists))
 
 
 def get_ip_from_equip(equip_id, url):
-    return get_json("%s/%s%s" % (url, "ipaddresses/?equipment=", equip_id))
+    return get_list("%s/%s%s" % (url, "ipaddresses/?equipment=", equip_id))
 
 
 def get_service_from_equip(equip_id, url):
-    return get_json("%s/%s%s" % (url, "services/?equipment=", equip_id))
+    return get_list("%s/%s%s" % (url, "services/?equipment=", equip_id))
+
+
+def get_net_equipment(equip_list):
+    net_equipment = None
+    for e in equip_list:
+        if re.search('modem', e['type'].lower()) or \
+           re.search('routeur', e['type'].lower()):
+            net_equipment = e
+    return net_equipment
+
+
+class NetworkIndex:
+    """
+    GISSMO collections fetched once and indexed by station.
+
+    Whatever the number of stations, building the index costs one request
+    per collection (plus one per operator), then every per-station lookup
+    is local.
+    """
+
+    collections = ['networks', 'sites', 'equipments', 'channels',
+                   'channel_parameters', 'ipaddresses', 'services']
+
+    def __init__(self, url):
+        self.url = url
+        self.sites = dict()  # station code -> site
+        self.docs = None  # station id -> documents
+        self.equipments = dict()  # station code -> equipments
+        self.channels = dict()  # station code -> channels
+        self.parameters = dict()  # channel id -> channel parameters
+        self.ipaddresses = dict()  # equipment id -> ip addresses
+        self.services = dict()  # equipment id -> services
+        self.networks = dict()  # network URL -> network
+        self._code_by_id = dict()
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            doc_future = pool.submit(get_doc_index, url)
+            fetched = dict((name, pool.submit(self._fetch, name))
+                           for name in self.collections)
+
+            for n in fetched['networks'].result():
+                self.networks[self._url_of('networks', n)] = n
+            for site in fetched['sites'].result():
+                self.sites[site['code']] = site
+                self._code_by_id[str(site['id'])] = site['code']
+            for e in fetched['equipments'].result():
+                self._add(self.equipments, self._station_code(e['station']),
+                          e)
+            for c in fetched['channels'].result():
+                self._add(self.channels, self._station_code(c['station']), c)
+            for p in fetched['channel_parameters'].result():
+                self._add(self.parameters, _id_from_url(p['channel']), p)
+            for ip in fetched['ipaddresses'].result():
+                self._add(self.ipaddresses, _id_from_url(ip['equipment']),
+                          ip)
+            for ser in fetched['services'].result():
+                self._add(self.services, _id_from_url(ser['equipment']), ser)
+            self.docs = doc_future.result()
+
+    def _url_of(self, name, item):
+        if 'url' in item:
+            return item['url']
+        return "%s/%s/%s/" % (self.url, name, item['id'])
+
+    def _fetch(self, name):
+        items = get_collection(name, self.url)
+        # later get_resource() calls on these items are served locally
+        if name in ['networks', 'sites', 'equipments', 'channels']:
+            for item in items:
+                _resources[self._url_of(name, item)] = item
+        return items
+
+    def _station_code(self, station):
+        # a station is referenced either by its URL or by its code
+        if station is None:
+            return None
+        if station in self.sites:
+            return station
+        return self._code_by_id.get(_id_from_url(station))
+
+    @staticmethod
+    def _add(index, key, item):
+        if key is not None:
+            index.setdefault(str(key), list()).append(item)
+
+    def station_codes(self, net_code=None):
+        if net_code is None:
+            return sorted(self.sites)
+        codes = set()
+        for sta_code, chan_list in self.channels.items():
+            for c in chan_list:
+                if self.networks.get(c['network'], {}).get('code') == \
+                   net_code:
+                    codes.add(sta_code)
+        return sorted(c for c in codes if c in self.sites)
+
+    def station_data(self, sta_code):
+        site = self.sites[sta_code]
+        equip_list = self.equipments.get(sta_code, list())
+        ip_list = list()
+        ser_list = list()
+        net_equipment = get_net_equipment(equip_list)
+        if net_equipment is not None:
+            ip_list = self.ipaddresses.get(str(net_equipment['id']), list())
+            ser_list = self.services.get(str(net_equipment['id']), list())
+        return {'sta_list': [site],
+                'doc_list': self.docs.get(site['id']),
+                'equip_list': equip_list,
+                'ip_list': ip_list,
+                'ser_list': ser_list,
+                'chan_list': self.channels.get(sta_code, list())}
+
+
+class FleetIndex:
+    """
+    Hash indexes, over every station of a NetworkIndex, of what a single
+    station should own: running equipments by (type, serial number),
+    public IPs and services by (public IP, port).
+
+    The indexes are filled in one pass over the equipments, so finding
+    collisions is linear in the size of the database. A service is only
+    reported when its public IP is not shared by the same stations, the
+    public IP error already covering it.
+    """
+
+    def __init__(self, index):
+        # key -> station codes
+        self.serial_numbers = dict()
+        self.public_ips = dict()
+        self.services = dict()
+        for sta_code, equip_list in index.equipments.items():
+            for e in equip_list:
+                if e['status'] == 'Running' and e['serial_number']:
+                    self._add(self.serial_numbers,
+                              (e['type'], e['serial_number']), sta_code)
+                for ip in index.ipaddresses.get(str(e['id']), list()):
+                    if not _is_public_ip(ip):
+                        continue
+                    self._add(self.public_ips, ip['ip'], sta_code)
+                    for ser in index.services.get(str(e['id']), list()):
+                        self._add(self.services, (ip['ip'], ser['port']),
+                                  sta_code)
+
+    @staticmethod
+    def _add(index, key, sta_code):
+        index.setdefault(key, set()).add(sta_code)
+
+    def collisions(self):
+        """Return the errors of the collisions, keyed by station code."""
+        findings = dict()
+        for rule, index, describe in [
+                ('fleet.serial_number', self.serial_numbers,
+                 lambda key: "%s #%s also running at" % key),
+                ('fleet.public_ip', self.public_ips,
+                 lambda key: "public IP %s also used at" % (key,)),
+                ('fleet.service', self.services,
+                 lambda key: "service on %s:%s also exposed at" % key)]:
+            for key, sta_codes in sorted(index.items(),
+                                         key=lambda kv: str(kv[0])):
+                if len(sta_codes) < 2 or \
+                   (rule == 'fleet.service' and
+                        self.public_ips.get(key[0]) == sta_codes):
+                    continue
+                for sta_code in sorted(sta_codes):
+                    others = sorted(sta_codes - set([sta_code]))
+                    findings.setdefault(sta_code, list()).append(Finding(
+                        'error', rule, "%s station%s %s" % (
+                            describe(key), 's' if len(others) > 1 else '',
+                            ", ".join(others)),
+                        values={'key': list(key) if isinstance(key, tuple)
+                                else key,
+                                'stations': others},
+                        station=sta_code))
+        return findings
+
+
+def _to_float(values):
+    array = np.empty(len(values))
+    for i, v in enumerate(values):
+        try:
+            array[i] = float(v)
+        except (TypeError, ValueError):
+            array[i] = np.nan
+    return array
+
+
+def _failures(items, rules):
+    """
+    Apply rules, a list of (rule, field, mask, message) where message builds
+    the message of a failing row, and return (row, finding) pairs ordered by
+    row, then by rule.
+    """
+    failures = list()
+    for order, (rule, field, mask, message) in enumerate(rules):
+        for i in np.flatnonzero(mask):
+            item = items[int(i)]
+            # only channels have a location code
+            channel = item['code'] if 'location_code' in item else None
+            failures.append((int(i), order,
+                             _error(rule, message(int(i)), channel,
+                                    {field: item.get(field)})))
+    failures.sort(key=lambda f: f[:2])
+    return [(i, f) for i, order, f in failures]
+
+
+def validate_positions(items):
+    """
+    Check the position of sites or channels, all at once.
+
+    Return (row, finding) pairs for the items failing a rule.
+    """
+    if len(items) == 0:
+        return list()
+    lat = _to_float([i['latitude'] for i in items])
+    lon = _to_float([i['longitude'] for i in items])
+    elev = _to_float([i['elevation'] for i in items])
+    with np.errstate(invalid='ignore'):
+        rules = [
+            ('position.latitude', 'latitude',
+             np.isnan(lat) | (np.absolute(lat) > 90),
+             lambda i: "latitude is %s" % (items[i]['latitude'])),
+            ('position.longitude', 'longitude',
+             np.isnan(lon) | (np.absolute(lon) > 180),
+             lambda i: "longitude is %s" % (items[i]['longitude'])),
+            ('position.elevation', 'elevation',
+             np.isnan(elev) | (elev < -11000) | (elev > 9000),
+             lambda i: "elevation is %s" % (items[i]['elevation'])),
+        ]
+    for unit in ['latitude', 'longitude', 'elevation']:
+        rules.append(('position.unit', unit + '_unit',
+                      np.array([i[unit + '_unit'] is None for i in items]),
+                      lambda i, unit=unit: "%s unit is None" % (unit)))
+    return _failures(items, rules)
+
+
+def validate_channels(chan_list):
+    """
+    Check azimuth, dip, sample rate and datatypes of channels against the
+    miniSEED conventions, all at once.
+
+    Return (row, finding) pairs for the channels failing a rule.
+    """
+    if len(chan_list) == 0:
+        return list()
+    code = [c['code'] for c in chan_list]
+    band = np.array([c[0] for c in code])
+    comp = np.array([c[-1] for c in code])
+    loc_00 = np.array([c['location_code'] == '00' for c in chan_list])
+    az = _to_float([c['azimuth'] for c in chan_list])
+    dip = _to_float([c['dip'] for c in chan_list])
+    rate = _to_float([c['sample_rate'] for c in chan_list])
+
+    def msg(values, text):
+        return lambda i: "%.2f %s %s" % (values[i], text, code[i])
+
+    with np.errstate(invalid='ignore'):
+        bad_az = np.isnan(az) | (az < 0) | (az > 360)
+        horizontal = np.isin(comp, ['E', 'N', '1', '2'])
+        rules = [
+            ('mseed.azimuth', 'azimuth', bad_az,
+             msg(az, "(should be in [0, 360]) not a consistent azimuth at "
+                     "channel")),
+            ('mseed.azimuth', 'azimuth',
+             ~bad_az & (comp == 'E') & (np.absolute(az - 90) > 5),
+             msg(az, "(should be in [85, 95]) not a consistent azimuth at "
+                     "channel")),
+            ('mseed.azimuth', 'azimuth',
+             ~bad_az & (comp == 'N') & (az > 5) & (az < 355),
+             msg(az, "(should not be in [5, 355]) not a consistent azimuth "
+                     "at channel")),
+            ('mseed.azimuth', 'azimuth',
+             ~bad_az & (comp == '1') & ((az < 5) | (az > 355)),
+             lambda i: "azimuth is %.2f, component should be 'N'" % (az[i])),
+            ('mseed.azimuth', 'azimuth',
+             ~bad_az & (comp == '2') & (np.absolute(az - 90) < 5),
+             msg(az, "(should not be in [85, 95]) not a consistent azimuth "
+                     "at channel")),
+            ('mseed.azimuth', 'azimuth',
+             ~bad_az & (comp == 'Z') & (az != 0),
+             msg(az, "(should be '0.0') not a consistent azimuth at channel")),
+            ('mseed.dip', 'dip', horizontal & (dip != 0),
+             msg(dip, "(should be '0.0') not a consistent dip at channel")),
+            ('mseed.dip', 'dip', (comp == 'Z') & (dip != -90),
+             msg(dip, "(should be '-90.0') not a consistent dip at channel")),
+            ('mseed.sample_rate', 'sample_rate',
+             (band == 'L') & loc_00 & (rate != 1),
+             msg(rate, "(should be '1.0') not a consistent sample rate at "
+                       "channel")),
+            ('mseed.sample_rate', 'sample_rate',
+             (band == 'H') & loc_00 & (rate != 100),
+             msg(rate, "(should be '100.0') not a consistent sample rate at "
+                       "channel")),
+        ]
+    for datatype in ['CONTINUOUS', 'GEOPHYSICAL']:
+        rules.append(('mseed.datatypes', 'datatypes',
+                      np.array([datatype not in c['datatypes']
+                                for c in chan_list]),
+                      lambda i, datatype=datatype:
+                      "'%s' not in datatypes at channel %s" %
+                      (datatype, code[i])))
+    return _failures(chan_list, rules)
+
+
+# failures found by validate_network(), keyed by _row_key(), so that the
+# per-station checks do not validate the same items again
+_validated_positions = dict()
+_validated_channels = dict()
+
+
+def _row_key(item):
+    # sites have no location code, channels always have one
+    return (item.get('location_code'), item['code'], item['id'])
+
+
+def validate_network(site_list, chan_list):
+    """
+    Validate positions and miniSEED conventions of every site and channel
+    of a network in one pass.
+    """
+    positioned = site_list + chan_list
+    for validated, items in [(_validated_positions, positioned),
+                             (_validated_channels, chan_list)]:
+        for item in items:
+            validated[_row_key(item)] = list()
+    for i, f in validate_positions(positioned):
+        _validated_positions[_row_key(positioned[i])].append(f)
+    for i, f in validate_channels(chan_list):
+        _validated_channels[_row_key(chan_list[i])].append(f)
 
 
 def _check_position(some_json):
     # tested
-    if some_json['latitude'] is None or \
-       np.absolute(float(some_json['latitude'])) > 90:
-        print("%s latitude is %s" % (bcolors.ERROR, some_json['latitude']))
-
-    if some_json['longitude'] is None or \
-       np.absolute(float(some_json['longitude'])) > 180:
-        print("%s longitude is %s" % (bcolors.ERROR, some_json['longitude']))
-
-    if some_json['elevation'] is None or \
-       float(some_json['elevation']) < -11000 or \
-       float(some_json['elevation']) > 9000:
-        print("%s elevation is %s" % (bcolors.ERROR, some_json['elevation']))
-
-    if some_json['latitude_unit'] is None:
-        print("%s latitude unit is None" % (bcolors.ERROR))
-    if some_json['longitude_unit'] is None:
-        print("%s longitude unit is None" % (bcolors.ERROR))
-    if some_json['elevation_unit'] is None:
-        print("%s elevation unit is None" % (bcolors.ERROR))
+    findings = _validated_positions.get(_row_key(some_json))
+    if findings is None:
+        findings = [f for i, f in validate_positions([some_json])]
+    yield from findings
 
 
 def _check_chan_mseed_standard(chan_json):
     # tested
-    azimuth = float(chan_json['azimuth'])
-    dip = float(chan_json['dip'])
-
-    if azimuth < 0 or azimuth > 360:
-        msg = "(should be in [0, 360]) not a consistent azimuth at channel"
-        print("%s %.2f %s %s" % (bcolors.ERROR, azimuth, msg,
-                                 chan_json['code']))
-    else:
-        if chan_json['code'][-1] == 'E':
-            if np.absolute(azimuth - 90) > 5:
-                msg = "(should be in [85, 95]) not a consistent azimuth at \
-channel"
-                print("%s %.2f %s %s" % (bcolors.ERROR, azimuth, msg,
-                                         chan_json['code']))
-        elif chan_json['code'][-1] == 'N':
-            if azimuth > 5 and azimuth < 355:
-                msg = "(should not be in [5, 355]) not a consistent azimuth \
-at channel"
-                print("%s %.2f %s %s" % (bcolors.ERROR, azimuth, msg,
-                                         chan_json['code']))
-        elif chan_json['code'][-1] == '1':
-            if azimuth < 5 or azimuth > 355:
-                print("%s azimuth is %.2f, component should be 'N'" %
-                      (bcolors.ERROR, azimuth))
-        elif chan_json['code'][-1] == '2':
-            if np.absolute(azimuth - 90) < 5:
-                msg = "(should not be in [85, 95]) not a consistent azimuth \
-at channel"
-                print("%s %.2f %s %s" % (bcolors.ERROR, azimuth, msg,
-                                         chan_json['code']))
-        elif chan_json['code'][-1] == 'Z':
-            if azimuth != 0:
-                msg = "(should be '0.0') not a consistent azimuth at channel"
-                print("%s %.2f %s %s" % (bcolors.ERROR, azimuth, msg,
-                                         chan_json['code']))
-
-    if chan_json['code'][-1] in ['E', 'N', '1', '2']:
-        if dip != 0:
-            msg = "(should be '0.0') not a consistent dip at channel"
-            print("%s %.2f %s %s" % (bcolors.ERROR, dip, msg,
-                                     chan_json['code']))
-    elif chan_json['code'][-1] == 'Z':
-        if dip != -90:
-            msg = "(should be '-90.0') not a consistent dip at channel"
-            print("%s %.2f %s %s" % (bcolors.ERROR, dip, msg,
-                                     chan_json['code']))
-
-    if chan_json['code'][0] == 'L' and chan_json['location_code'] == '00':
-        if float(chan_json['sample_rate']) != 1:
-            msg = "(should be '1.0') not a consistent sample rate at channel"
-            print("%s %.2f %s %s" % (bcolors.ERROR, chan_json['sample_rate'],
-                                     msg, chan_json['code']))
-    elif chan_json['code'][0] == 'H' and chan_json['location_code'] == '00':
-        if float(chan_json['sample_rate']) != 100:
-            msg = "(should be '100.0') not a consistent sample rate at channel"
-            print("%s %.2f %s %s" % (bcolors.ERROR, chan_json['sample_rate'],
-                                     msg, chan_json['code']))
-
-    if 'CONTINUOUS' not in chan_json['datatypes']:
-        msg = "'CONTINUOUS' not in datatypes at channel"
-        print("%s %s %s" % (bcolors.ERROR, msg, chan_json['code']))
-    if 'GEOPHYSICAL' not in chan_json['datatypes']:
-        msg = "'GEOPHYSICAL' not in datatypes at channel"
-        print("%s %s %s" % (bcolors.ERROR, msg, chan_json['code']))
+    findings = _validated_channels.get(_row_key(chan_json))
+    if findings is None:
+        findings = [f for i, f in validate_channels([chan_json])]
+    yield from findings
 
     requested = ['Velocimeter', 'Datalogger']
     for e in chan_json['equipments']:
-        _c_equip = get_json(e)
+        _c_equip = get_resource(e)
         requested.pop(requested.index(_c_equip['type']))
     for r in requested:
         msg = "missing at channel"
-        print("%s %s %s %s" % (bcolors.ERROR, r, msg,
-                               chan_json['code']))
+        yield _error('mseed.equipment',
+                     "%s %s %s" % (r, msg, chan_json['code']),
+                     chan_json['code'], {'type': r})
 
 
 def _check_chan_attribute(chan_list, param):
@@ -173,42 +964,46 @@ def _check_chan_attribute(chan_list, param):
             _p.sort()
     if _param_list.count(_param_list[0]) != len(_param_list):
         msg = "are not consistent between channels"
-        print("%s %s %s" % (bcolors.ERROR, param, msg))
+        yield _error('channels.attribute', "%s %s" % (param, msg),
+                     values={'attribute': param})
 
 
 def check_station(sta_list):
     # tested
     sta_json = sta_list[0]
-    operator_json = get_json(sta_json['operator'])
-
-    print("Station code: %s" % (sta_json['code']))
-    print("Name: %s" % (sta_json['name']))
-    print("Position:")
-    print("    Latitude: %s %s" % (sta_json['latitude'],
-                                   sta_json['latitude_unit']))
-    print("    Longitude: %s %s" % (sta_json['longitude'],
-                                    sta_json['longitude_unit']))
-    print("    Elevation: %s %s" % (sta_json['elevation'],
-                                    sta_json['elevation_unit']))
-    print("Type: %s" % (sta_json['type']))
-    print("Status: %s" % (sta_json['status']))
-    print("Geology: %s" % (sta_json['geology']))
-    print("Operator organization: %s" % (operator_json['name']))
-
-    _check_position(sta_json)
+    operator_json = get_resource(sta_json['operator'])
+
+    yield _info("Station code: %s" % (sta_json['code']))
+    yield _info("Name: %s" % (sta_json['name']))
+    yield _info("Position:")
+    yield _info("    Latitude: %s %s" % (sta_json['latitude'],
+                                         sta_json['latitude_unit']))
+    yield _info("    Longitude: %s %s" % (sta_json['longitude'],
+                                          sta_json['longitude_unit']))
+    yield _info("    Elevation: %s %s" % (sta_json['elevation'],
+                                          sta_json['elevation_unit']))
+    yield _info("Type: %s" % (sta_json['type']))
+    yield _info("Status: %s" % (sta_json['status']))
+    yield _info("Geology: %s" % (sta_json['geology']))
+    yield _info("Operator organization: %s" % (operator_json['name']))
+
+    yield from _check_position(sta_json)
 
     if sta_json['status'] != "Running":
-        print("%s current status is '%s'" % (bcolors.ERROR,
-                                             sta_json['status']))
+        yield _error('station.status',
+                     "current status is '%s'" % (sta_json['status']),
+                     values={'status': sta_json['status']})
 
     if sta_json['geology'] == '':
-        print("%s geology not filled" % (bcolors.WARNING))
+        yield _warning('station.geology', "geology not filled")
 
     if operator_json['name'] == "Unknown":
-        print("%s operator unknown" % (bcolors.ERROR))
+        yield _error('station.operator', "operator unknown")
 
     if sta_json['type'] != "Measuring site":
-        print("%s current type is '%s'" % (bcolors.ERROR, sta_json['type']))
+        yield _error('station.type',
+                     "current type is '%s'" % (sta_json['type']),
+                     values={'type': sta_json['type']})
 
 
 def check_docs(doc_list):
@@ -216,12 +1011,13 @@ def check_docs(doc_list):
     requested = ["Lease", "Datasheet", "Picture", "Analysis report",
                  "Site proposal"]
     if len(doc_list) == 0:
-        print("%s no document related to this station" % (bcolors.ERROR))
+        yield _error('docs.missing', "no document related to this station")
     else:
-        print("Documents:")
+        yield _info("Documents:")
         for d in doc_list:
-            print("    %s '%s' available at %s" % (d['doctype'], d['title'],
-                                                   d['link']))
+            yield _info("    %s '%s' available at %s" % (d['doctype'],
+                                                         d['title'],
+                                                         d['link']))
             if d['doctype'] in requested:
                 requested.pop(requested.index(d['doctype']))
             if re.search("dossier_proposition_site_", d['link']) and \
@@ -230,7 +1026,9 @@ def check_docs(doc_list):
 
         if len(requested) > 0:
             for r in requested:
-                print("%s no %s related to this station" % (bcolors.ERROR, r))
+                yield _error('docs.missing',
+                             "no %s related to this station" % (r),
+                             values={'doctype': r})
 
 
 def check_sta_equipments(equip_list):
@@ -239,12 +1037,13 @@ def check_sta_equipments(equip_list):
                  "Modem"]
 
     if len(equip_list) == 0:
-        print("%s no equipement installed at this station" % (bcolors.ERROR))
+        yield _error('equipments.missing',
+                     "no equipement installed at this station")
     else:
-        print("Current equipments:")
+        yield _info("Current equipments:")
         for e in equip_list:
-            print("    %s %s #%s %s" % (e['type'], e['name'],
-                                        e['serial_number'], e['status']))
+            yield _info("    %s %s #%s %s" % (e['type'], e['name'],
+                                              e['serial_number'], e['status']))
             if e['type'] in requested:
                 requested.pop(requested.index(e['type']))
             elif re.search('modem', e['type'].lower())\
@@ -253,176 +1052,304 @@ def check_sta_equipments(equip_list):
 
         for e in equip_list:
             if e['status'] != "Running":
-                print("%s %s %s #%s current status is '%s'" %
-                      (bcolors.ERROR, e['type'], e['name'], e['serial_number'],
-                       e['status']))
+                yield _error('equipments.status',
+                             "%s %s #%s current status is '%s'" %
+                             (e['type'], e['name'], e['serial_number'],
+                              e['status']),
+                             values={'type': e['type'],
+                                     'serial_number': e['serial_number'],
+                                     'status': e['status']})
         if len(requested) > 0:
             for r in requested:
-                print("%s no %s installed at this station" %
-                      (bcolors.ERROR, r))
+                yield _error('equipments.missing',
+                             "no %s installed at this station" % (r),
+                             values={'type': r})
+
+
+def _is_public_ip(ip):
+    return ip['ip'][:7] != '192.168' and ip['ip'][:3] != '10.' and \
+        ip['netmask'] == '0.0.0.0'
 
 
 def check_ips(ip_list):
     # tested
     public_ip = list()
-    print("Wide Area Network configuration (found on the modem):")
+    yield _info("Wide Area Network configuration (found on the modem):")
     for ip in ip_list:
-        if ip['ip'][:7] != '192.168' and ip['ip'][:3] != '10.' and \
-           ip['netmask'] == '0.0.0.0':
+        if _is_public_ip(ip):
             public_ip.append(ip)
     if len(public_ip) == 0:
         msg = "no public ip found, should be configured at modem level"
-        print("%s %s" % (bcolors.ERROR, msg))
+        yield _error('network.public_ip', msg)
     else:
         for ip in public_ip:
-            print("    Public IP: %s" % (ip['ip']))
+            yield _info("    Public IP: %s" % (ip['ip']))
 
 
 def check_services(ser_list):
     # tested
     if len(ser_list) == 0:
         msg = "no network services available"
-        print("%s %s" % (bcolors.ERROR, msg))
+        yield _error('network.services', msg)
     else:
         for s in ser_list:
-            print("    %s available on port %s (%s)" % (s['protocol'],
-                                                        s['port'],
-                                                        s['description']))
-
-
-def check_chan_list(chan_list, url):
-    print("Velocimtric channels affiliated to RLBP network \
+            yield _info("    %s available on port %s (%s)" %
+                        (s['protocol'], s['port'], s['description']))
+
+
+class ChannelRecord:
+    __slots__ = ['loc', 'band', 'instrument', 'component', 'azimuth', 'dip',
+                 'chan']
+
+    def __init__(self, chan_json):
+        self.loc = chan_json['location_code']
+        self.band = chan_json['code'][0]
+        self.instrument = chan_json['code'][1]
+        self.component = chan_json['code'][2:]
+        self.azimuth = chan_json['azimuth']
+        self.dip = chan_json['dip']
+        self.chan = chan_json
+
+
+class ChannelTable:
+    """
+    Channels indexed by (location, band, instrument, component), so that
+    comparing a channel with the other channels of its station is a
+    constant-time lookup.
+    """
+
+    # horizontal component expected with each horizontal component
+    orthogonal = {'N': 'E', 'E': 'N', '1': '2', '2': '1'}
+    orientations = [set(['Z', 'N', 'E']), set(['Z', '1', '2'])]
+
+    def __init__(self, chan_list):
+        self.records = [ChannelRecord(c) for c in chan_list]
+        self._index = dict()
+        # (location, band, instrument) -> components
+        self._streams = dict()
+        for r in self.records:
+            self._index[(r.loc, r.band, r.instrument, r.component)] = r
+            self._streams.setdefault((r.loc, r.band, r.instrument),
+                                     set()).add(r.component)
+
+    def get(self, loc, band, instrument, component):
+        return self._index.get((loc, band, instrument, component))
+
+    def inconsistent_streams(self):
+        """Streams mixing orientations, e.g. Z1N instead of Z12 or ZNE."""
+        return [stream for stream, components in self._streams.items()
+                if not any(components <= o for o in self.orientations)]
+
+
+class Epoch:
+    __slots__ = ['start', 'end', 'owner', 'item']
+
+    def __init__(self, start, end, owner=None, item=None):
+        self.start = start
+        self.end = end
+        self.owner = owner
+        self.item = item
+
+
+def _epoch_time(date):
+    """Timestamp of an ISO 8601 date of the API, None being open ended."""
+    if date is None:
+        return float('inf')
+    t = datetime.datetime.fromisoformat(date.replace('Z', '+00:00'))
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=datetime.timezone.utc)
+    return t.timestamp()
+
+
+class EpochIndex:
+    """
+    Epochs grouped by key, e.g. (net, sta, loc, cha) or a serial number.
+
+    The epochs of a key are sorted by start date once, then overlaps and
+    gaps are found in one pass keeping the epoch ending last, so a key with
+    n epochs costs O(n log n) instead of comparing every pair.
+    """
+
+    def __init__(self):
+        self._epochs = dict()
+        self._sorted = False
+
+    def add(self, key, start, end, owner=None, item=None):
+        self._epochs.setdefault(key, list()).append(
+            Epoch(start, end, owner, item))
+        self._sorted = False
+
+    def _sweep(self):
+        if not self._sorted:
+            for epochs in self._epochs.values():
+                epochs.sort(key=lambda e: (e.start, e.end))
+            self._sorted = True
+        return sorted(self._epochs.items(), key=lambda kv: str(kv[0]))
+
+    def overlaps(self, across_owners=False):
+        """
+        Yield (key, earlier, later) for each epoch starting before the end
+        of an earlier epoch of its key. With across_owners, only epochs of
+        different owners are compared.
+        """
+        for key, epochs in self._sweep():
+            # owner -> epoch of that owner ending last so far
+            last = dict()
+            for e in epochs:
+                owner = e.owner if across_owners else None
+                for o, previous in last.items():
+                    if (o != owner or not across_owners) and \
+                       previous.end > e.start:
+                        yield key, previous, e
+                if owner not in last or e.end > last[owner].end:
+                    last[owner] = e
+
+    def gaps(self):
+        """Yield (key, earlier, later) for each hole between epochs."""
+        for key, epochs in self._sweep():
+            last = None
+            for e in epochs:
+                if last is not None and e.start > last.end:
+                    yield key, last, e
+                if last is None or e.end > last.end:
+                    last = e
+
+
+def _param_counter(param_list):
+    return Counter((p['model'], p['parameter'], p['value'])
+                   for p in param_list)
+
+
+def check_chan_list(chan_list, url, param_index=None):
+    yield _info("Velocimtric channels affiliated to RLBP network \
 (net='FR', loc='00', cha='?H?'):")
     if len(chan_list) == 0:
         msg = "no channel related to this station"
-        print("%s %s" % (bcolors.ERROR, msg))
+        yield _error('channels.missing', msg)
     else:
         # filter open 'H' channels with net code 'FR' and loc code '00'
+        resolve_resources(c['network'] for c in chan_list)
         kept_chan_list = list()
         for c in chan_list:
-            net = get_json(c['network'])['code']
+            net = get_resource(c['network'])['code']
             if c['end_date'] is None and net == 'FR' and \
                c['location_code'] == '00' and c['code'][1] == 'H':
                 kept_chan_list.append(c)
 
         if len(kept_chan_list) == 0:
             msg = "available channels are not affiliated to RLBP network"
-            print("%s %s" % (bcolors.ERROR, msg))
+            yield _error('channels.network', msg)
         else:
             # test if station code is coherent between channels (should be)
-            _check_chan_attribute(chan_list, 'station')
-            sta_json = get_json(kept_chan_list[0]['station'])
+            yield from _check_chan_attribute(chan_list, 'station')
+            _links = [kept_chan_list[0]['station']]
+            for c in kept_chan_list:
+                _links.extend(c['equipments'])
+            resolve_resources(_links)
+            sta_json = get_resource(kept_chan_list[0]['station'])
 
             # test if HH streams are present (mandatory)
             _stream_list = [_chan['code'][:2] for _chan in kept_chan_list]
+            _table = ChannelTable(kept_chan_list)
             if _stream_list.count('HH') != 3:
                     msg = "no or missing 'HH' channels, mandatory"
-                    print("%s %s" % (bcolors.ERROR, msg))
-            # test if H streams are consistent (ie Z12 or ZNE, not Z1N)
-            # TODO
+                    yield _error('channels.hh', msg)
             else:
                 # test if LH streams are present
                 if _stream_list.count('LH') != 3:
                     msg = "no or missing 'LH' channels"
-                    print("%s %s" % (bcolors.ERROR, msg))
-                _chan_list = [_chan['code'] for _chan in kept_chan_list]
-                _azimuth_list = [_chan['azimuth'] for _chan in kept_chan_list]
-                _dip_list = [_chan['dip'] for _chan in kept_chan_list]
-                for _chan in _chan_list:
+                    yield _error('channels.lh', msg)
+                # test if streams are consistent (ie Z12 or ZNE, not Z1N)
+                for loc, band, instrument in _table.inconsistent_streams():
+                    msg = "comp. codes should be Z12 or ZNE at stream"
+                    yield _error('channels.orientation',
+                                 "%s %s" % (msg, band + instrument),
+                                 values={'stream': band + instrument})
+                for r in _table.records:
+                    _chan = r.chan['code']
+                    _hh = _table.get(r.loc, 'H', 'H', r.component)
                     # test if components are identical between streams
-                    if _chan.replace(_chan[:2], 'HH') not in _chan_list:
+                    if _hh is None:
                         msg = "comp. codes not consistent with HH at channel"
-                        print("%s %s %s" % (bcolors.ERROR, msg, _chan))
-                    else:
-                        # test azimuth between streams
-                        if _azimuth_list[_chan_list.index(_chan)] != \
-                           _azimuth_list[_chan_list.index(
-                                         _chan.replace(_chan[:1], 'H'))]:
-                            msg = "azimuth not consistent with HH at channel"
-                            print("%s %s %s" % (bcolors.ERROR, msg, _chan))
-                        # test dip between streams
-                        if _dip_list[_chan_list.index(_chan)] != \
-                           _dip_list[_chan_list.index(_chan.replace(_chan[:1],
-                                                                    'H'))]:
-                            msg = "dip not consistent with HH at channel"
-                            print("%s %s %s" % (bcolors.ERROR, msg, _chan))
-                        # test if azimuth are consistent between channels
-                        if _chan[-1] in ['1', 'N']:
-                            _index_n = _chan_list.index(_chan)
-                            if _chan[-1] == '1':
-                                _index_e = _chan_list.index(_chan.replace('1',
-                                                                          '2'))
-                            elif _chan[-1] == 'N':
-                                _index_e = _chan_list.index(_chan.replace('N',
-                                                                          'E'))
-                            _az_n = _azimuth_list[_index_n]
-                            _az_e = _azimuth_list[_index_e]
-                            if "%.1f" % ((float(_az_n) + 90) % 360) != _az_e:
-                                msg = "azimuth not consistent between \
+                        yield _error('channels.components',
+                                     "%s %s" % (msg, _chan), _chan)
+                        continue
+                    # test azimuth between streams
+                    if r.azimuth != _hh.azimuth:
+                        msg = "azimuth not consistent with HH at channel"
+                        yield _error('channels.azimuth',
+                                     "%s %s" % (msg, _chan), _chan,
+                                     {'azimuth': r.azimuth,
+                                      'hh_azimuth': _hh.azimuth})
+                    # test dip between streams
+                    if r.dip != _hh.dip:
+                        msg = "dip not consistent with HH at channel"
+                        yield _error('channels.dip',
+                                     "%s %s" % (msg, _chan), _chan,
+                                     {'dip': r.dip, 'hh_dip': _hh.dip})
+                    # test if azimuth are consistent between channels
+                    if r.component in ['1', 'N']:
+                        _e = _table.get(r.loc, r.band, r.instrument,
+                                        _table.orthogonal[r.component])
+                        if _e is not None and \
+                           "%.1f" % ((float(r.azimuth) + 90) % 360) != \
+                           _e.azimuth:
+                            msg = "azimuth not consistent between \
 horizontal channels, check"
-                                print("%s %s %s" % (bcolors.ERROR, msg,
-                                                    _chan[:2]))
-
-                _check_chan_attribute(kept_chan_list, 'depth')
-                _check_chan_attribute(kept_chan_list, 'depth_unit')
-                _check_chan_attribute(kept_chan_list, 'latitude')
-                _check_chan_attribute(kept_chan_list, 'latitude_unit')
-                _check_chan_attribute(kept_chan_list, 'longitude')
-                _check_chan_attribute(kept_chan_list, 'longitude_unit')
-                _check_chan_attribute(kept_chan_list, 'elevation')
-                _check_chan_attribute(kept_chan_list, 'elevation_unit')
-                _check_chan_attribute(kept_chan_list, 'clock_drift')
-                _check_chan_attribute(kept_chan_list, 'clock_drift_unit')
-                _check_chan_attribute(kept_chan_list, 'sample_rate_unit')
-                _check_chan_attribute(kept_chan_list, 'calibration_units')
-                _check_chan_attribute(kept_chan_list, 'datatypes')
-                _check_chan_attribute(kept_chan_list, 'storage_format')
-                _check_chan_attribute(kept_chan_list, 'equipments')
+                            yield _error('channels.horizontal_azimuth',
+                                         "%s %s" % (msg, _chan[:2]), _chan,
+                                         {'azimuth': r.azimuth,
+                                          'orthogonal_azimuth': _e.azimuth})
+
+                for param in ['depth', 'depth_unit', 'latitude',
+                              'latitude_unit', 'longitude', 'longitude_unit',
+                              'elevation', 'elevation_unit', 'clock_drift',
+                              'clock_drift_unit', 'sample_rate_unit',
+                              'calibration_units', 'datatypes',
+                              'storage_format', 'equipments']:
+                    yield from _check_chan_attribute(kept_chan_list, param)
+
+                # parameters of all kept channels at once
+                if param_index is None:
+                    param_index = get_parameters_from_chans(
+                        [c['id'] for c in kept_chan_list], url)
 
                 # get channel parameters of HHZ channel as reference
-                _hhz_all_param = None
+                _hhz_params = None
                 for c in kept_chan_list:
                     if c['code'] == 'HHZ':
-                            _hhz_all_param = get_parameter_from_chan(c['id'],
-                                                                     url)
-                            _hhz_model_list = [_param['model']
-                                               for _param in _hhz_all_param]
-                            _hhz_param_list = [_param['parameter']
-                                               for _param in _hhz_all_param]
-                            _hhz_value_list = [_param['value']
-                                               for _param in _hhz_all_param]
-                            _hhz_model_list.sort()
-                            _hhz_param_list.sort()
-                            _hhz_value_list.sort()
+                        _hhz_params = _param_counter(
+                            param_index.get(str(c['id']), list()))
 
                 for c in kept_chan_list:
-                    _check_chan_mseed_standard(c)
+                    yield from _check_chan_mseed_standard(c)
                     # test position coherence and if different from station
-                    _check_position(c)
+                    yield from _check_position(c)
                     if c['latitude'] != sta_json['latitude'] or \
                        c['longitude'] != sta_json['longitude'] or \
                        c['elevation'] != sta_json['elevation']:
                         msg = "channel position differs from station position"
-                        print("%s %s %s" % (bcolors.WARNING, c['code'], msg))
-
-                    # test equipments parameters between channels
-                    _c_all_param = get_parameter_from_chan(c['id'], url)
-                    if len(_c_all_param) == 0:
+                        yield _warning('channels.position',
+                                       "%s %s" % (c['code'], msg), c['code'])
+
+                    # test equipments parameters between channels, keyed
+                    # by (model, parameter)
+                    _c_params = _param_counter(
+                        param_index.get(str(c['id']), list()))
+                    if len(_c_params) == 0:
                         msg = "no parameters at channel"
-                        print("%s %s %s" % (bcolors.ERROR, msg, c['code']))
-                    elif _hhz_all_param is not None:
-                        _model_list = [_param['model']
-                                       for _param in _c_all_param]
-                        _param_list = [_param['parameter']
-                                       for _param in _c_all_param]
-                        _value_list = [_param['value']
-                                       for _param in _c_all_param]
-                        _model_list.sort()
-                        _param_list.sort()
-                        _value_list.sort()
-                        if _value_list != _hhz_value_list:
-                            msg = "parameters not consistent for channel"
-                            print("%s %s %s" % (bcolors.ERROR, msg, c['code']))
+                        yield _error('channels.parameters',
+                                     "%s %s" % (msg, c['code']), c['code'])
+                    elif _hhz_params is not None and _c_params != _hhz_params:
+                        _diff = sorted(set(
+                            "%s %s" % (m, p) for m, p, v in
+                            (_c_params - _hhz_params) +
+                            (_hhz_params - _c_params)))
+                        msg = "parameters not consistent for channel"
+                        yield _error('channels.parameters',
+                                     "%s %s (%s)" % (msg, c['code'],
+                                                     ", ".join(_diff)),
+                                     c['code'], {'parameters': _diff})
 
                 # plotting stats
                 net = 'FR'
@@ -430,88 +1357,603 @@ horizontal channels, check"
                 for c in kept_chan_list:
                     loc = c['location_code']
                     cha = c['code']
-                    print("    %s.%s.%s.%s" % (net, sta, loc, cha))
+                    yield _info("    %s.%s.%s.%s" % (net, sta, loc, cha))
                     if c['code'][-1] == 'Z':
-                        print("        Sample rate: %s %s" %
-                              (c['sample_rate'], c['sample_rate_unit']))
+                        yield _info("        Sample rate: %s %s" %
+                                    (c['sample_rate'], c['sample_rate_unit']))
 
-                for c in kept_chan_list:
-                    if c['code'] == 'HHZ':
-                        c_hhz = c
-                    elif c['code'] == 'HH1' or c['code'] == 'HHN':
-                        c_hhn = c
+                c_hhz = _table.get('00', 'H', 'H', 'Z')
+                c_hhn = _table.get('00', 'H', 'H', '1') or \
+                    _table.get('00', 'H', 'H', 'N')
+                if c_hhz is None or c_hhn is None:
+                    return
+                c_hhz = c_hhz.chan
+                c_hhn = c_hhn.chan
 
                 velocimeter_json = None
                 datalogger_json = None
                 for e in c_hhz['equipments']:
-                    e_json = get_json(e)
+                    e_json = get_resource(e)
                     if e_json['type'] == 'Datalogger':
                         datalogger_json = e_json
                     elif e_json['type'] == 'Velocimeter':
                         velocimeter_json = e_json
-                p_list = get_parameter_from_chan(c_hhz['id'], url)
-
-                print("    All velocimetric channels:")
-                print("        Latitude: %s %s" % (c_hhz['latitude'],
-                                                   c_hhz['latitude_unit']))
-                print("        Longitude: %s %s" % (c_hhz['longitude'],
-                                                    c_hhz['longitude_unit']))
-                print("        Elevation: %s %s" % (c_hhz['elevation'],
-                                                    c_hhz['elevation_unit']))
-                print("        Depth: %s %s" % (c_hhz['depth'],
-                                                c_hhz['depth_unit']))
-                print("        Azimuth: %s %s" % (c_hhn['azimuth'],
-                                                  c_hhn['azimuth_unit']))
-                print("        Vertical dip: %s %s" % (c_hhz['dip'],
-                                                       c_hhn['dip_unit']))
+                p_list = param_index.get(str(c_hhz['id']), list())
+
+                yield _info("    All velocimetric channels:")
+                yield _info("        Latitude: %s %s" %
+                            (c_hhz['latitude'], c_hhz['latitude_unit']))
+                yield _info("        Longitude: %s %s" %
+                            (c_hhz['longitude'], c_hhz['longitude_unit']))
+                yield _info("        Elevation: %s %s" %
+                            (c_hhz['elevation'], c_hhz['elevation_unit']))
+                yield _info("        Depth: %s %s" %
+                            (c_hhz['depth'], c_hhz['depth_unit']))
+                yield _info("        Azimuth: %s %s" %
+                            (c_hhn['azimuth'], c_hhn['azimuth_unit']))
+                yield _info("        Vertical dip: %s %s" %
+                            (c_hhz['dip'], c_hhn['dip_unit']))
                 if velocimeter_json is not None:
-                    print("        Velocimeter: %s #%s" %
-                          (velocimeter_json['name'],
-                           velocimeter_json['serial_number']))
+                    yield _info("        Velocimeter: %s #%s" %
+                                (velocimeter_json['name'],
+                                 velocimeter_json['serial_number']))
                 if datalogger_json is not None:
-                    print("        Datalogger: %s #%s" %
-                          (datalogger_json['name'],
-                           datalogger_json['serial_number']))
+                    yield _info("        Datalogger: %s #%s" %
+                                (datalogger_json['name'],
+                                 datalogger_json['serial_number']))
                 if len(c_hhz['datatypes']) > 0:
-                    print("        Datatypes:")
+                    yield _info("        Datatypes:")
                     for d in c_hhz['datatypes']:
-                        print("            %s" % d)
+                        yield _info("            %s" % d)
                 if len(p_list) > 0:
-                    print("        Instrument parameters:")
+                    yield _info("        Instrument parameters:")
                     for p in p_list:
-                        print("            %s %s %s" % (p['model'],
-                                                        p['parameter'],
-                                                        p['value']))
+                        yield _info("            %s %s %s" %
+                                    (p['model'], p['parameter'], p['value']))
+
+
+def _epoch_dates(chan_json):
+    return "%s - %s" % (chan_json['start_date'],
+                        chan_json['end_date'] or "open")
+
+
+def check_epochs(chan_list):
+    """
+    Check the epoch history of every channel of a station, closed epochs
+    included: epochs of a channel should neither overlap nor leave gaps.
+    """
+    resolve_resources(chain((c['network'] for c in chan_list),
+                            (c['station'] for c in chan_list)))
+    index = EpochIndex()
+    for c in chan_list:
+        seed_id = "%s.%s.%s.%s" % (get_resource(c['network'])['code'],
+                                   get_resource(c['station'])['code'],
+                                   c['location_code'], c['code'])
+        try:
+            index.add(seed_id, _epoch_time(c['start_date']),
+                      _epoch_time(c['end_date']), item=c)
+        except (AttributeError, TypeError, ValueError):
+            yield _error('epochs.date',
+                         "invalid epoch dates at channel %s (%s)" %
+                         (seed_id, _epoch_dates(c)), c['code'],
+                         {'start_date': c['start_date'],
+                          'end_date': c['end_date']})
+    for seed_id, earlier, later in index.overlaps():
+        yield _error('epochs.overlap',
+                     "epochs overlap at channel %s (%s and %s)" %
+                     (seed_id, _epoch_dates(earlier.item),
+                      _epoch_dates(later.item)),
+                     later.item['code'],
+                     {'epoch': [earlier.item['start_date'],
+                                earlier.item['end_date']],
+                      'overlapping_epoch': [later.item['start_date'],
+                                            later.item['end_date']]})
+    for seed_id, earlier, later in index.gaps():
+        yield _warning('epochs.gap',
+                       "gap between epochs at channel %s (from %s to %s)" %
+                       (seed_id, earlier.item['end_date'],
+                        later.item['start_date']),
+                       later.item['code'],
+                       {'gap': [earlier.item['end_date'],
+                                later.item['start_date']]})
+
+
+def equipment_conflicts(channels):
+    """
+    Return the errors of equipments installed at two stations over the same
+    period, as lists of findings keyed by station code.
+
+    channels maps station codes to their channels (every epoch), the
+    equipments being identified by their serial number.
+    """
+    resolve_resources(e for chan_list in channels.values()
+                      for c in chan_list for e in c['equipments'])
+    index = EpochIndex()
+    for sta_code, chan_list in channels.items():
+        for c in chan_list:
+            try:
+                start = _epoch_time(c['start_date'])
+                end = _epoch_time(c['end_date'])
+            except (AttributeError, TypeError, ValueError):
+                # reported by check_epochs()
+                continue
+            for e in c['equipments']:
+                serial_number = get_resource(e).get('serial_number')
+                if serial_number:
+                    index.add(serial_number, start, end, sta_code, c)
+
+    # one error per station, serial number and other station
+    conflicts = dict()
+    for serial_number, earlier, later in index.overlaps(across_owners=True):
+        for epoch, other in [(earlier, later), (later, earlier)]:
+            key = (epoch.owner, serial_number, other.owner)
+            if key not in conflicts:
+                conflicts[key] = Finding(
+                    'error', 'equipments.epochs',
+                    "equipment #%s also installed at station %s (%s)" %
+                    (serial_number, other.owner, _epoch_dates(other.item)),
+                    epoch.item['code'],
+                    {'serial_number': serial_number,
+                     'station': other.owner,
+                     'epoch': [other.item['start_date'],
+                               other.item['end_date']]},
+                    station=epoch.owner)
+    findings = dict()
+    for (sta_code, serial_number, other), f in sorted(conflicts.items()):
+        findings.setdefault(sta_code, list()).append(f)
+    return findings
+
+
+def fetch_station_data(sta_code, url):
+    """
+    Fetch what the checks need for one station, running independent
+    requests concurrently (at most `jobs` at a time).
+
+    Return None if the station does not exist.
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        sta_future = pool.submit(get_station_json, sta_code, url)
+        doc_index_future = pool.submit(get_doc_index, url)
+        equip_future = pool.submit(get_equip_from_station, sta_code, url)
+        chan_future = pool.submit(get_chan_from_station, sta_code, url)
+
+        equip_list = equip_future.result()
+        net_equipment = get_net_equipment(equip_list)
+        ip_future = None
+        ser_future = None
+        if net_equipment is not None:
+            ip_future = pool.submit(get_ip_from_equip, net_equipment['id'],
+                                    url)
+            ser_future = pool.submit(get_service_from_equip,
+                                     net_equipment['id'], url)
+
+        sta_list = sta_future.result()
+        if len(sta_list) == 0:
+            return None
+        # warm the operator lookup of check_station()
+        pool.submit(get_resource, sta_list[0]['operator'])
+
+        return {'sta_list': sta_list,
+                'doc_list': doc_index_future.result().get(sta_list[0]['id']),
+                'equip_list': equip_list,
+                'ip_list': ip_future.result() if ip_future else list(),
+                'ser_list': ser_future.result() if ser_future else list(),
+                'chan_list': chan_future.result()}
+
+
+def dump_snapshot(path, url):
+    """
+    Write into path a snapshot of every item the checks use, for later
+    runs with --snapshot.
+    """
+    index = NetworkIndex(url)
+    resolve_resources(site['operator'] for site in index.sites.values())
+    snapshot.write_snapshot(path, url, _snapshot_rows(index))
+    return index
+
+
+def _snapshot_rows(index):
+    for net_url, n in index.networks.items():
+        yield 'networks', net_url, {'code': n['code']}, n
+    for sta_code, site in index.sites.items():
+        yield 'sites', index._url_of('sites', site), {'code': sta_code}, site
+    for sta_id, doc_list in index.docs.docs.items():
+        keys = {'station': index._code_by_id.get(sta_id)}
+        for d in doc_list:
+            yield 'documents', None, keys, d
+    for sta_code, equip_list in index.equipments.items():
+        for e in equip_list:
+            yield ('equipments', index._url_of('equipments', e),
+                   {'station': sta_code}, e)
+    for sta_code, chan_list in index.channels.items():
+        for c in chan_list:
+            yield ('channels', index._url_of('channels', c),
+                   {'station': sta_code}, c)
+    for chan_id, param_list in index.parameters.items():
+        for p in param_list:
+            yield 'channel_parameters', None, {'channel': chan_id}, p
+    for equip_id, ip_list in index.ipaddresses.items():
+        for ip in ip_list:
+            yield 'ipaddresses', None, {'equipment': equip_id}, ip
+    for equip_id, ser_list in index.services.items():
+        for ser in ser_list:
+            yield 'services', None, {'equipment': equip_id}, ser
+    # operators, and items not linked to any station
+    for res_url, res in _resources.items():
+        yield res_url.rstrip('/').split('/')[-2], res_url, {}, res
 
 
 def check_overall_single_station(sta_code, url):
 
-    sta_list = get_station_json(sta_code, url)
-    if len(sta_list) == 0:
-        print("%s station code not existing in database" % (bcolors.ERROR))
+    data = fetch_station_data(sta_code, url)
+    if data is None:
+        yield Finding('error', 'station.unknown',
+                      "station code not existing in database",
+                      station=sta_code)
     else:
-        doc_list = get_docs_from_station(sta_list[0]['id'], url)
-        equip_list = get_equip_from_station(sta_code, url)
-        chan_list = get_chan_from_station(sta_code, url)
-
-        net_equipment = None
-        for e in equip_list:
-            if re.search('modem', e['type'].lower()) or \
-               re.search('routeur', e['type'].lower()):
-                net_equipment = e
-
-        ip_list = list()
-        ser_list = list()
-        if net_equipment is not None:
-            ip_list = get_ip_from_equip(net_equipment['id'], url)
-            ser_list = get_service_from_equip(net_equipment['id'], url)
-
-        check_station(sta_list)
-        check_docs(doc_list)
-        check_sta_equipments(equip_list)
-        check_ips(ip_list)
-        check_services(ser_list)
-        check_chan_list(chan_list, url)
+        yield from check_all(url=url, **data)
+
+
+def check_all(sta_list, doc_list, equip_list, ip_list, ser_list, chan_list,
+              url, param_index=None):
+    """Yield the findings of every check of a station, as they come."""
+    sta_code = sta_list[0]['code']
+    checks = [check_station(sta_list),
+              check_docs(doc_list),
+              check_sta_equipments(equip_list),
+              check_ips(ip_list),
+              check_services(ser_list),
+              check_chan_list(chan_list, url, param_index)]
+    if epoch_checks:
+        checks.append(check_epochs(chan_list))
+    for f in chain(*checks):
+        f.station = sta_code
+        yield f
+
+
+def _digest(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8'))\
+        .hexdigest()
+
+
+class CheckState:
+    """
+    Findings of previous runs per station, with a digest of the station
+    data they were computed from.
+
+    The state is dropped as a whole when the checks themselves (this file)
+    or the set of enabled checks changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        rules = hashlib.sha1()
+        with open(__file__, 'rb') as f:
+            rules.update(f.read())
+        rules.update(json.dumps(enabled_checks(),
+                                sort_keys=True).encode('utf-8'))
+        self.rules = rules.hexdigest()
+        self.stations = dict()
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = dict()
+        if saved.get('rules') == self.rules:
+            self.stations = saved['stations']
+
+    def findings(self, sta_code, digest, check):
+        """
+        Yield the findings of station sta_code: the saved ones if its data
+        digest did not change, the ones yielded by check() otherwise.
+        """
+        saved = self.stations.get(sta_code)
+        if saved is not None and saved['digest'] == digest:
+            for f in saved['findings']:
+                yield Finding(**f)
+            return
+        findings = list()
+        for f in check():
+            findings.append(f.as_dict())
+            yield f
+        self.stations[sta_code] = {'digest': digest, 'findings': findings}
+
+    def save(self):
+        tmp_path = "%s.tmp" % (self.path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'rules': self.rules, 'stations': self.stations}, f)
+        os.replace(tmp_path, self.path)
+
+
+def station_digest(data, param_index, shared=None):
+    """
+    Digest of everything the checks of a station depend on: its data,
+    the parameters of its channels, the resources they link to and its
+    findings against other stations.
+    """
+    links = set([data['sta_list'][0]['operator']])
+    for c in data['chan_list']:
+        links.add(c['network'])
+        links.add(c['station'])
+        links.update(c['equipments'])
+    resolve_resources(links)
+    return _digest({'data': data,
+                    'parameters': [param_index.get(str(c['id']), list())
+                                   for c in data['chan_list']],
+                    'links': dict((u, get_resource(u)) for u in links),
+                    'shared': shared})
+
+
+def check_network(net_code, url, state=None):
+    """
+    Check every station of network net_code (every station of the
+    database if net_code is None) from collections fetched only once.
+    Equipments, public IPs and services are also compared across every
+    station of the database, see FleetIndex.
+
+    With a CheckState, stations whose data did not change since the
+    previous run are not checked again, their saved findings are reported.
+    """
+    index = NetworkIndex(url)
+    sta_codes = index.station_codes(net_code)
+    validate_network([index.sites[sta_code] for sta_code in sta_codes],
+                     [c for sta_code in sta_codes
+                      for c in index.channels.get(sta_code, list())])
+    # findings depending on other stations, selected or not
+    shared = FleetIndex(index).collisions()
+    if epoch_checks:
+        for sta_code, findings in equipment_conflicts(index.channels).items():
+            shared.setdefault(sta_code, list()).extend(findings)
+    if len(sta_codes) == 0:
+        yield _error('station.unknown', "no station found in database")
+    for i, sta_code in enumerate(sta_codes):
+        if i > 0:
+            yield Finding('info', 'report', "", station=sta_code)
+        data = index.station_data(sta_code)
+        sta_shared = shared.get(sta_code, list())
+
+        def check(data=data, sta_shared=sta_shared):
+            yield from check_all(url=url, param_index=index.parameters,
+                                 **data)
+            yield from sta_shared
+
+        if state is None:
+            yield from check()
+        else:
+            digest = station_digest(data, index.parameters,
+                                    [f.as_dict() for f in sta_shared])
+            yield from state.findings(sta_code, digest, check)
+
+
+class DiffSource:
+    """
+    One side of a diff: a snapshot file, or 'live' for the API at url
+    queried through live_client.
+    """
+
+    def __init__(self, name, url, live_client):
+        self.name = name
+        if name == 'live':
+            self.client = live_client
+            self.url = url
+        else:
+            self.client = snapshot.SnapshotClient(name)
+            self.url = self.client.url
+        self.index = None
+        self.resources = dict()
+        self.links = dict()
+
+    def activate(self):
+        """Make the get_* helpers and the checks read from this side."""
+        global client
+        client = self.client
+        reset_run_caches()
+        _resources.update(self.resources)
+
+    def load(self):
+        self.activate()
+        self.index = NetworkIndex(self.url)
+        resolve_resources(site['operator']
+                          for site in self.index.sites.values())
+        self.resources = dict(_resources)
+        self.links = dict((res_url, _link_key(res_url, res))
+                          for res_url, res in self.resources.items())
+        return self.index
+
+    def comparable(self, item):
+        """
+        item without its id and URL, its hyperlinks replaced by the keys of
+        the resources linked, so that the items of both sides compare equal
+        whatever the URL each side was read from.
+        """
+        def key(value):
+            if not isinstance(value, str):
+                return value
+            if value in self.links:
+                return self.links[value]
+            if value.startswith(self.url):
+                return value[len(self.url):]
+            return value
+
+        return dict((k, [key(v) for v in value] if isinstance(value, list)
+                     else key(value))
+                    for k, value in item.items() if k not in ['id', 'url'])
+
+
+def _link_key(res_url, res):
+    # what identifies a hyperlinked resource whatever the database ids:
+    # the type and serial number of an equipment, the code of a station or
+    # a network, the name of an operator
+    if res_url.rstrip('/').split('/')[-2] == 'equipments':
+        return "%s #%s" % (res.get('type'), res.get('serial_number'))
+    for field in ['code', 'name']:
+        if res.get(field):
+            return res[field]
+    return res_url
+
+
+# kinds of items compared by diff, in report order
+DIFF_KINDS = ['site', 'document', 'equipment', 'ipaddress', 'service',
+              'channel', 'parameter']
+
+
+def station_records(source, sta_code):
+    """
+    Items of station sta_code in DiffSource source by kind, each kind
+    mapping a key that does not depend on the database ids (e.g.
+    FR.CHMF.00.HHZ <start date> for a channel epoch) to the item as
+    compared (see DiffSource.comparable), or to the values of a parameter.
+    """
+    index = source.index
+    site = index.sites[sta_code]
+    records = dict((kind, dict()) for kind in DIFF_KINDS)
+
+    def add(kind, key, item):
+        # items sharing a key are told apart by their rank
+        n = 1
+        unique_key = key
+        while unique_key in records[kind]:
+            n += 1
+            unique_key = "%s (%d)" % (key, n)
+        records[kind][unique_key] = source.comparable(item)
+
+    add('site', sta_code, site)
+    for d in index.docs.get(site['id']):
+        add('document', "%s %s" % (d['doctype'], d['link']), d)
+    for e in index.equipments.get(sta_code, list()):
+        add('equipment', "%s #%s" % (e['type'], e['serial_number']), e)
+        for ip in index.ipaddresses.get(str(e['id']), list()):
+            add('ipaddress', ip['ip'], ip)
+        for ser in index.services.get(str(e['id']), list()):
+            add('service', "%s %s" % (ser['protocol'], ser['port']), ser)
+    for c in index.channels.get(sta_code, list()):
+        chan_key = "%s.%s.%s.%s %s" % (
+            index.networks.get(c['network'], {}).get('code'), sta_code,
+            c['location_code'], c['code'], c['start_date'])
+        add('channel', chan_key, c)
+        for p in index.parameters.get(str(c['id']), list()):
+            records['parameter'].setdefault(
+                "%s %s %s" % (chan_key, p['model'], p['parameter']),
+                list()).append(p['value'])
+    return records
+
+
+def _station_state(source, sta_code):
+    # (digest, records, record digests) of a station, None if missing
+    if sta_code not in source.index.sites:
+        return None
+    records = station_records(source, sta_code)
+    hashes = dict((kind, dict((key, _digest(item))
+                              for key, item in items.items()))
+                  for kind, items in records.items())
+    return _digest(hashes), records, hashes
+
+
+def _change(sta_code, kind, change, key, sign, values=None):
+    values = dict(values or {}, kind=kind, change=change, key=key)
+    return Finding('change', 'diff.%s' % (kind),
+                   "%s %s %s" % (sign, kind, key), station=sta_code,
+                   values=values)
+
+
+def _diff_records(sta_code, old, new):
+    """Yield the changes of the items of a station, by kind."""
+    old_records, old_hashes = old[1:] if old else (dict(), dict())
+    new_records, new_hashes = new[1:] if new else (dict(), dict())
+    for kind in DIFF_KINDS:
+        old_keys = old_hashes.get(kind, dict())
+        new_keys = new_hashes.get(kind, dict())
+        for key in sorted(old_keys):
+            if key not in new_keys:
+                yield _change(sta_code, kind, 'removed', key, '-')
+        for key in sorted(new_keys):
+            if key not in old_keys:
+                yield _change(sta_code, kind, 'added', key, '+')
+            elif old_keys[key] != new_keys[key]:
+                a = old_records[kind][key]
+                b = new_records[kind][key]
+                if isinstance(a, dict):
+                    fields = sorted(k for k in set(a) | set(b)
+                                    if a.get(k) != b.get(k))
+                    f = _change(sta_code, kind, 'modified', key, '~',
+                                {'fields': fields})
+                    f.message += " (%s)" % (", ".join(fields))
+                else:
+                    f = _change(sta_code, kind, 'modified', key, '~',
+                                {'old': a, 'new': b})
+                    f.message += " (%s -> %s)" % (
+                        ", ".join(str(v) for v in a),
+                        ", ".join(str(v) for v in b))
+                yield f
+
+
+def _finding_key(f):
+    return (f.severity, f.rule, f.channel, f.message)
+
+
+def diff_sources(old, new, net_code=None):
+    """
+    Yield the differences between the databases of DiffSource old and new:
+    items added, removed or modified per station, then the errors and
+    warnings these changes introduced or fixed.
+
+    Stations are compared by a digest of their items, so only the ones
+    that changed are compared item by item and checked again, on both
+    sides. The client of the run is restored once both sides are checked.
+    """
+    global client
+    run_client = client
+    old_index = old.load()
+    new_index = new.load()
+    sta_codes = sorted(set(old_index.station_codes(net_code)) |
+                       set(new_index.station_codes(net_code)))
+    changed = list()
+    for sta_code in sta_codes:
+        a = _station_state(old, sta_code)
+        b = _station_state(new, sta_code)
+        if a is None or b is None or a[0] != b[0]:
+            changed.append((sta_code, a, b))
+
+    # findings of the changed stations, each side checked from its data
+    findings = dict()
+    for source in [old, new]:
+        source.activate()
+        for sta_code, a, b in changed:
+            if sta_code in source.index.sites:
+                data = source.index.station_data(sta_code)
+                findings[(source, sta_code)] = Counter(
+                    _finding_key(f)
+                    for f in check_all(url=source.url,
+                                       param_index=source.index.parameters,
+                                       **data)
+                    if f.severity != 'info')
+    client = run_client
+    reset_run_caches()
+
+    for i, (sta_code, a, b) in enumerate(changed):
+        if i > 0:
+            yield Finding('info', 'report', "", station=sta_code)
+        status = 'modified'
+        if a is None:
+            status = 'added'
+        elif b is None:
+            status = 'removed'
+        yield Finding('info', 'report', "Station %s: %s" % (sta_code, status),
+                      station=sta_code)
+        yield from _diff_records(sta_code, a, b)
+        before = findings.get((old, sta_code), Counter())
+        after = findings.get((new, sta_code), Counter())
+        for change, sign, keys in [('fixed', '-', before - after),
+                                   ('introduced', '+', after - before)]:
+            for severity, rule, channel, message in sorted(keys):
+                yield Finding('change', 'diff.finding',
+                              "%s [%s] %s" % (sign, severity, message),
+                              channel, {'change': change,
+                                        'severity': severity,
+                                        'rule': rule},
+                              station=sta_code)
+    yield Finding('info', 'report', "%d of %d stations changed" %
+                  (len(changed), len(sta_codes)))
 
 
 if __name__ == '__main__':
@@ -519,5 +1961,82 @@ if __name__ == '__main__':
     # Uncomment for debug
     # print(args)
 
-    gissmo_url = 'https://gissmo.unistra.fr/api/v1'
-    check_overall_single_station(args['--sta'], gissmo_url)
+    gissmo_url = args['--url'].rstrip('/')
+    # both sides of a diff may come from the same URL
+    doc_index_path = None if args['diff'] else args['--doc-index']
+    jobs = int(args['--jobs'])
+    epoch_checks = args['--epochs']
+    if args['--snapshot']:
+        client = snapshot.SnapshotClient(args['--snapshot'])
+        gissmo_url = client.url
+    else:
+        client.set_timeouts(float(args['--connect-timeout']),
+                            float(args['--timeout']))
+        client.set_pool_size(max(jobs, 10))
+        client.scheduler = scheduler.RequestScheduler(
+            float(args['--rate']), jobs, int(args['--retries']))
+        if not args['--no-cache']:
+            cache_path = args['--cache'] or http_cache.DEFAULT_PATH
+            client.cache = http_cache.HttpCache(
+                os.path.expanduser(cache_path), refresh=args['--refresh'])
+
+    profiler = None
+    if args['--profile']:
+        profiler = profiling.Profiler(gissmo_url)
+        profiler.instrument(globals())
+        client = profiler.client(client)
+
+    if args['--format'] not in SINKS:
+        sys.exit("unknown report format '%s'" % (args['--format']))
+    output = sys.stdout
+    if args['--output']:
+        output = open(args['--output'], 'w', newline='')
+    sink = SINKS[args['--format']](output)
+
+    sides = list()
+    state = None
+    if args['--state'] and not args['--sta']:
+        state = CheckState(args['--state'])
+
+    def check():
+        if args['--sta']:
+            return check_overall_single_station(args['--sta'], gissmo_url)
+        return check_network(args['--network'], gissmo_url, state)
+
+    if args['snapshot']:
+        index = dump_snapshot(args['<file>'], gissmo_url)
+        print("%d stations written to %s" % (len(index.sites),
+                                             args['<file>']))
+    elif args['diff']:
+        sides = [DiffSource(args['<old>'], gissmo_url, client),
+                 DiffSource(args['<new>'], gissmo_url, client)]
+        for side in sides:
+            if side.client is not client and profiler is not None:
+                side.client = profiler.client(side.client)
+        report(diff_sources(sides[0], sides[1], args['--network']), sink)
+    elif args['--watch']:
+        def check_again():
+            reset_run_caches(keep_resources=True)
+            return check()
+
+        host, port = args['--listen'].rsplit(':', 1)
+        watch.serve(watch.Watcher(check_again, float(args['--interval']),
+                                  state),
+                    host, int(port))
+    else:
+        report(check(), sink)
+        if state is not None:
+            state.save()
+    if output is not sys.stdout:
+        output.close()
+
+    if args['--stats']:
+        client.print_stats()
+        # snapshot sides of a diff
+        for side in sides:
+            if side.client is not client:
+                print("%s:" % (side.name), file=sys.stderr)
+                side.client.print_stats()
+    if profiler is not None:
+        profiler.print_summary()
+        profiler.save(args['--profile'])
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Watch mode of station_check.py.
+
+The configured stations are checked again every `interval` seconds, or on
+demand, by a long-running process that keeps its HTTP connections and
+caches warm. The latest findings of each station are served as JSON:
+
+    GET  /                  status of the watcher
+    GET  /stations          error and warning counts per station
+    GET  /stations/<code>   errors and warnings of a station
+    POST /refresh           check the stations again now
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import sys
+import threading
+import time
+import traceback
+
+
+class Watcher:
+    """
+    Periodic runner of check, a callable returning the findings of a fresh
+    run of the checks, keeping the latest errors and warnings per station.
+
+    state is the station_check.CheckState used by check, if any, saved
+    after each run.
+    """
+
+    def __init__(self, check, interval=3600, state=None):
+        self.check_stations = check
+        self.interval = interval
+        self.state = state
+        self.results = dict()
+        self.last_check = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def check(self):
+        results = dict()
+        for f in self.check_stations():
+            if f.station is None:
+                continue
+            station = results.setdefault(f.station, list())
+            if f.severity != 'info':
+                station.append(f.as_dict())
+        checked = time.time()
+        with self._lock:
+            for sta_code, findings in results.items():
+                self.results[sta_code] = {'checked': checked,
+                                          'findings': findings}
+            self.last_check = checked
+            self.last_error = None
+        if self.state is not None:
+            self.state.save()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception:
+                with self._lock:
+                    self.last_error = traceback.format_exc()
+                print(self.last_error, file=sys.stderr)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def status(self):
+        with self._lock:
+            return {'interval': self.interval,
+                    'stations': len(self.results),
+                    'last_check': self.last_check,
+                    'last_error': self.last_error}
+
+    def summary(self):
+        summary = dict()
+        with self._lock:
+            for sta_code, r in self.results.items():
+                severities = [f['severity'] for f in r['findings']]
+                summary[sta_code] = {'checked': r['checked'],
+                                     'errors': severities.count('error'),
+                                     'warnings': severities.count('warning')}
+        return summary
+
+    def station(self, sta_code):
+        with self._lock:
+            return self.results.get(sta_code)
+
+
+class WatchHandler(BaseHTTPRequestHandler):
+    """JSON endpoint over the results of server.watcher."""
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        watcher = self.server.watcher
+        path = self.path.split('?')[0].rstrip('/')
+        if path == '':
+            self._send(200, watcher.status())
+        elif path == '/stations':
+            self._send(200, watcher.summary())
+        elif path.startswith('/stations/'):
+            result = watcher.station(path[len('/stations/'):])
+            if result is None:
+                self._send(404, {'error': 'unknown station'})
+            else:
+                self._send(200, result)
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') == '/refresh':
+            self.server.watcher.refresh()
+            self._send(202, {'refresh': 'scheduled'})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(watcher, host='127.0.0.1', port=8080):
+    """Serve the results of watcher while it checks, until interrupted."""
+    server = ThreadingHTTPServer((host, port), WatchHandler)
+    server.daemon_threads = True
+    server.watcher = watcher
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print("Serving findings on http://%s:%d/" % (host, port),
+          file=sys.stderr)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        server.shutdown()
+        server.server_close()